@@ -0,0 +1,185 @@
+# load climate anomaly series for ClimateSmoothing
+# Based on: http://climatedatablog.wordpress.com/2014/03/15/r-code-for-simple-rss-graph/
+from __future__ import division
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+RSS_URL = "http://data.remss.com/msu/graphics/TLT/time_series/RSS_TS_channel_TLT_Global_Land_And_Sea_v03_3.txt"
+HADCRUT_URL = "http://www.metoffice.gov.uk/hadobs/hadcrut4/data/current/time_series/HadCRUT.4.2.0.0.monthly_ns_avg.txt"
+# value used by the data sets for missing anomalies
+MISSING_VALUE = -99.9
+# parsed copies of remote series are kept here (see cachedSeries)
+CACHE_DIR = os.environ.get("CLIMATE_DATA_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "ClimateData"))
+# directory of local copies of the remote files, named like the last part of
+# their URL; when set, remote hosts are never contacted
+FIXTURE_DIR = os.environ.get("CLIMATE_DATA_FIXTURES")
+
+def decimalYear(year,month):
+    """
+    Converts a year and month (1-12) to a decimal year centred on the month.
+    Inputs:
+        year: year, or array/Series of years
+        month: month, or array/Series of months
+    Outputs:
+        date: decimal year(s), Year + Month/12 - 1/24
+    """
+    return year + month/12.0 - 1/24.0
+
+def parseYearMonth(dates):
+    """
+    Converts "YYYY/MM" date strings to decimal years (see decimalYear).
+    All dates are parsed at once with string slicing.
+    Inputs:
+        dates: Series (or sequence) of "YYYY/MM" strings
+    Outputs:
+        date: Series of decimal years
+    """
+    dates = pd.Series(dates).astype(str).str
+    return decimalYear(dates[:4].astype(int), dates[-2:].astype(int))
+
+def loadSeries(source,names=("Year","Month","Anomaly"),skiprows=0,missing=MISSING_VALUE):
+    """
+    Loads a whitespace separated anomaly file, such as a station file.
+    Inputs:
+        source: file name, URL or file object
+        names: names of the leading columns to keep. It must contain "Year"
+            and "Anomaly". With a "Month" column the date is built from Year and
+            Month, otherwise Year must hold "YYYY/MM" strings.
+        skiprows: number of header lines to skip
+        missing: anomaly value marking missing data; those rows are dropped
+            (None keeps every row)
+    Outputs:
+        df: DataFrame with the named columns plus "Date" as a decimal year
+    """
+    names = list(names)
+    dtype = None if "Month" in names else {0: str}
+    df = pd.read_csv(source,sep=r"\s+",skiprows=skiprows,header=None,dtype=dtype)
+    # usecols is not reliable for these files, so keep the leading columns
+    df = df.iloc[:,:len(names)]
+    df.columns = names
+    if missing is not None:
+        df = df[df.Anomaly != missing]
+        df = df.reset_index(drop=True)
+    # make the date a decimal year
+    if "Month" in names:
+        df["Date"] = decimalYear(df.Year,df.Month)
+    else:
+        df["Date"] = parseYearMonth(df.Year)
+    return df
+
+def loadRSS(source=RSS_URL):
+    """Loads the RSS TLT monthly anomalies (Year, Month, Anomaly, Date)."""
+    return loadSeries(source,names=("Year","Month","Anomaly"),skiprows=5)
+
+def loadHadCRUT(source=HADCRUT_URL):
+    """Loads the HadCRUT4 monthly anomalies (Year as "YYYY/MM", Anomaly, Date)."""
+    return loadSeries(source,names=("Year","Anomaly"))
+
+def _isUrl(source):
+    return "://" in str(source)
+
+def _hasParquet():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+def _cachePath(cacheDir,source,loader,kwargs):
+    """Returns the cache directory of a source loaded with loader(**kwargs)."""
+    key = repr((str(source), loader.__name__, sorted(kwargs.items())))
+    return os.path.join(cacheDir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+def _writeCache(path,df,source):
+    """Stores df column by column (or as parquet) under the directory path."""
+    tmp = "%s.tmp%d" % (path, os.getpid())
+    os.makedirs(tmp)
+    meta = {"source": str(source), "fetched": time.time(), "columns": list(df.columns)}
+    if _hasParquet():
+        meta["format"] = "parquet"
+        df.to_parquet(os.path.join(tmp, "data.parquet"))
+    else:
+        meta["format"] = "npy"
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(os.path.join(tmp, "%d.npy" % i), values)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+def _readCache(path):
+    """Returns (df, meta) from a cache directory, or (None, None) if it is missing."""
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None, None
+    if meta["format"] == "parquet":
+        df = pd.read_parquet(os.path.join(path, "data.parquet"), memory_map=True)
+    else:
+        df = pd.DataFrame(dict(
+            (column, np.load(os.path.join(path, "%d.npy" % i), mmap_mode="r"))
+            for i, column in enumerate(meta["columns"])), columns=meta["columns"])
+    return df, meta
+
+def cachedSeries(source,loader=loadSeries,cacheDir=None,ttl=None,refresh=False,
+                 offline=False,fixtureDir=None,**kwargs):
+    """
+    Loads a series with loader, keeping a parsed binary copy of remote sources.
+    Remote series are stored per URL in cacheDir, as parquet when pyarrow is
+    available and as one memory-mapped .npy file per column otherwise, so later
+    runs skip the download and the text parsing.
+    Inputs:
+        source: URL, file name or file object passed on to loader
+        loader: function turning source into a DataFrame (default loadSeries)
+        cacheDir: cache directory (default CACHE_DIR)
+        ttl: age in seconds after which a cached copy is downloaded again
+            (default: never)
+        refresh: download again even if a cached copy is fresh
+        offline: never download; use the cached copy however old it is and
+            raise IOError if there is none
+        fixtureDir: directory with local copies of remote files, named like the
+            last part of the URL. They are loaded instead of the URL, and
+            sources without a fixture are treated as offline.
+            (default FIXTURE_DIR)
+        **kwargs: passed on to loader
+    Outputs:
+        df: the loaded DataFrame
+    Example:
+        df = cachedSeries(RSS_URL, loadRSS, ttl=7*24*3600)
+    """
+    if fixtureDir is None:
+        fixtureDir = FIXTURE_DIR
+    if not _isUrl(source):
+        return loader(source,**kwargs)
+    if fixtureDir:
+        fixture = os.path.join(fixtureDir, str(source).rstrip("/").rsplit("/",1)[-1])
+        if os.path.exists(fixture):
+            return loader(fixture,**kwargs)
+        offline = True
+    if cacheDir is None:
+        cacheDir = CACHE_DIR
+    path = _cachePath(cacheDir,source,loader,kwargs)
+    df, meta = _readCache(path)
+    if df is not None and not refresh:
+        if offline or ttl is None or time.time() - meta["fetched"] < ttl:
+            return df
+    if offline:
+        if df is not None:
+            return df
+        raise IOError("%s is not cached in %s and offline is set" % (source, cacheDir))
+    df = loader(source,**kwargs)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    _writeCache(path,df,source)
+    return df
@@ -1,23 +1,201 @@
 # do some climate data filtering
 # Based on: http://climatedatablog.wordpress.com/2014/03/15/r-code-for-simple-rss-graph/
 from __future__ import division
-import pandas as pd
-from math import factorial
-from mpl_toolkits.axes_grid.inset_locator import zoomed_inset_axes, mark_inset, inset_axes
-import pylab
+import mmap
+import os
+import sys
+from collections import OrderedDict
 import numpy as np
+# pandas, matplotlib and ClimateData are imported where they are used, so that
+# the filters can be imported quickly and without a display
+
+# Filter coefficients only depend on the filter settings, so they are cached
+# and shared between filter passes and series.
+_CACHE_SIZE = 32
+_sgCache = OrderedDict()
+_ctrmCache = OrderedDict()
+
+def _cached(cache,key,build):
+    """
+    Returns cache[key], calling build(*key) to fill it on a miss.
+    The least recently used entry is evicted once _CACHE_SIZE is reached.
+    """
+    try:
+        value = cache.pop(key)
+    except KeyError:
+        value = build(*key)
+        while len(cache) >= _CACHE_SIZE:
+            cache.popitem(last=False)
+    cache[key] = value
+    return value
+
+# kernels longer than this are applied with an FFT instead of np.convolve
+_FFT_KERNEL_LEN = 128
+# number of samples filtered together when smoothing many short kernels at once
+_BLOCK_SIZE = 2**14
+
+def _correlateValid(y,kernel):
+    """
+    Slides kernel along the last axis of y and returns the n - len(kernel) + 1
+    weighted sums that do not need padding, i.e.
+    out[...,i] = sum(kernel * y[...,i:i+len(kernel)]).
+    Long kernels are applied through an FFT. Every series of an N-D array is
+    filtered at once. An FFT would spread a NaN or inf sample over the whole
+    series, so series with non-finite samples are convolved directly and only
+    the windows containing them are affected.
+    """
+    kernel = np.asarray(kernel,dtype=float)
+    n = y.shape[-1]
+    nOut = n - len(kernel) + 1
+    if len(kernel) > _FFT_KERNEL_LEN:
+        nfft = 1 << (n + len(kernel) - 2).bit_length()
+        finite = np.isfinite(y).all(axis=-1)
+        if np.all(finite):
+            full = np.fft.irfft(np.fft.rfft(y,nfft) * np.fft.rfft(kernel[::-1],nfft), nfft)
+            return full[...,len(kernel)-1:n]
+        y2 = y.reshape(-1,n)
+        finite = finite.reshape(-1)
+        out = np.empty((y2.shape[0],nOut))
+        if finite.any():
+            full = np.fft.irfft(np.fft.rfft(y2[finite],nfft) * np.fft.rfft(kernel[::-1],nfft), nfft)
+            out[finite] = full[:,len(kernel)-1:n]
+        for row in np.flatnonzero(~finite):
+            out[row] = np.convolve(y2[row], kernel[::-1], mode='valid')
+        return out.reshape(y.shape[:-1] + (nOut,))
+    if y.ndim == 1:
+        return np.convolve(y, kernel[::-1], mode='valid')
+    # one multiply-add per kernel tap over a block of series at a time, with
+    # blocks small enough to stay in cache between taps
+    y2 = y.reshape(-1,n)
+    out = np.empty((y2.shape[0],nOut))
+    rows = max(1, _BLOCK_SIZE // max(n,1))
+    for start in range(0,y2.shape[0],rows):
+        block = y2[start:start+rows]
+        acc = out[start:start+rows]
+        np.multiply(kernel[0], block[:,:nOut], out=acc)
+        for k in range(1,len(kernel)):
+            acc += kernel[k] * block[:,k:k+nOut]
+    return out.reshape(y.shape[:-1] + (nOut,))
+
+def _asArray(x,axis):
+    """
+    Returns x as a float ndarray with the axis to filter moved to the end,
+    together with the normalized axis and the DataFrame x came from (if any).
+    DataFrames are filtered column by column unless axis says otherwise.
+    """
+    frame = None
+    # a DataFrame can only exist once pandas has been imported
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(x,pd.DataFrame):
+        frame = x
+        if axis is None:
+            axis = 0
+    elif axis is None:
+        axis = -1
+    y = np.asarray(x,dtype=float)
+    axis = axis % y.ndim
+    return np.moveaxis(y,axis,-1), axis, frame
+
+def _fromArray(y,axis,frame,frontLen=0,backLen=0):
+    """
+    Undoes _asArray on the filtered data y. DataFrames come back as DataFrames
+    with their labels trimmed by frontLen and backLen along the filtered axis.
+    """
+    y = np.moveaxis(y,-1,axis)
+    if frame is None:
+        return y
+    import pandas as pd
+    index, columns = frame.index, frame.columns
+    if axis == 0:
+        index = index[int(frontLen):len(index)-int(backLen)]
+    else:
+        columns = columns[int(frontLen):len(columns)-int(backLen)]
+    return pd.DataFrame(y,index=index,columns=columns)
 
 # Make the smoothing functions
+def _runningMean(x,window_len):
+    """
+    Running mean computed from compensated prefix sums.
+    The cost does not depend on window_len. np.cumsum adds the samples in
+    order, so the rounding error of every addition can be recovered exactly
+    (Knuth's TwoSum) and accumulated separately, which keeps long float64
+    series as accurate as a direct summation. NaN and inf samples are left
+    out of the sums and only set the windows that contain them, to the value
+    a direct summation gives.
+    Inputs:
+        x: ndarray of data to be smoothed along its last axis
+        window_len: size of window for averaging
+    Outputs:
+        y: ndarray of n - window_len + 1 averaged values per series
+    """
+    x = np.asarray(x,dtype=float)
+    n = x.shape[-1]
+    original = x
+    finite = np.isfinite(x)
+    allFinite = finite.all()
+    # removing the mean keeps the prefix sums small; non-finite samples are
+    # left out of it and replaced by it, so they add nothing to the sums
+    if not n:
+        shift = 0.0
+    elif allFinite:
+        shift = x.mean(axis=-1,keepdims=True)
+    else:
+        shift = (np.where(finite,x,0.0).sum(axis=-1,keepdims=True) /
+                 np.maximum(finite.sum(axis=-1,keepdims=True),1))
+        x = np.where(finite,x,shift)
+    x = x - shift
+    hi = np.zeros(x.shape[:-1] + (n+1,))
+    np.cumsum(x, axis=-1, out=hi[...,1:])
+    a = hi[...,1:-1]
+    b = x[...,1:]
+    s = hi[...,2:]
+    bb = s - a
+    lo = np.zeros(hi.shape)
+    np.cumsum((a - (s - bb)) + (b - bb), axis=-1, out=lo[...,2:])
+    y = (hi[...,window_len:] - hi[...,:-window_len]) + (lo[...,window_len:] - lo[...,:-window_len])
+    y = y/window_len + shift
+    if not allFinite:
+        _maskWindows(y,original,window_len)
+    return y
+
+def _windowCounts(mask,window_len):
+    """Number of True samples of mask in every window along the last axis."""
+    counts = np.zeros(mask.shape[:-1] + (mask.shape[-1]+1,),dtype=np.intp)
+    np.cumsum(mask, axis=-1, out=counts[...,1:])
+    return counts[...,window_len:] - counts[...,:-window_len]
+
+def _maskWindows(y,x,window_len):
+    """
+    Sets the running means y of the windows of x with NaN or inf samples to
+    what a direct summation gives: inf or -inf if those samples are all
+    infinite with the same sign, NaN otherwise.
+    """
+    pos = _windowCounts(x == np.inf,window_len)
+    neg = _windowCounts(x == -np.inf,window_len)
+    nan = _windowCounts(np.isnan(x),window_len)
+    y[(nan > 0) | ((pos > 0) & (neg > 0))] = np.nan
+    y[(pos > 0) & (neg == 0) & (nan == 0)] = np.inf
+    y[(neg > 0) & (pos == 0) & (nan == 0)] = -np.inf
+
 # based on: http://wiki.scipy.org/Cookbook/SignalSmooth
-def smooth(x,window_len=12):
+def smooth(x,window_len=12,method='convolve',axis=None):
     """
     Standard running mean smoother. Does not add mirrored data to
     the ends of the input data. 
     Inputs:
-        x: 1-D ndarray of data to be smoothed
+        x: ndarray (1-D or N-D) or DataFrame of data to be smoothed
         window_len: size of window for averaging
+        method: 'convolve' (default) convolves with a flat window, with
+            np.convolve up to 128 samples and through an FFT for longer
+            windows (series with NaN or inf samples always use np.convolve, so
+            only the windows containing them are NaN or inf). 'cumsum' uses
+            compensated prefix sums, whose runtime does not depend on
+            window_len and which also keeps non-finite samples local
+        axis: axis along which to smooth; every other axis indexes a separate
+            series. Defaults to the last axis, or to the rows of a DataFrame
+            (each column is one series).
     Outputs:
-        y: 1-D ndarray of smoothed data
+        y: ndarray (or DataFrame) of smoothed data
         frontLen: index of where y's data starts, relative to x
         backLend: index of wheere y's data ends, relative to the end of x
     Example:
@@ -28,40 +206,148 @@ def smooth(x,window_len=12):
         pylab.plot(index[frontLen:-backLen],y,'-k')
         pylab.axis([-.2,9.2,.8,8.2])
     """
-    w=np.ones(window_len,'d')
-    y=np.convolve(x,w/w.sum(),mode='valid')
+    x, axis, frame = _asArray(x,axis)
+    if method == 'convolve':
+        w=np.ones(window_len,'d')
+        y=_correlateValid(x,w/w.sum())
+    elif method == 'cumsum':
+        y=_runningMean(x,window_len)
+    else:
+        raise ValueError("method must be 'convolve' or 'cumsum', not %r" % (method,))
     # split it as evenly as possible, but put more space in the front
     # This introduces potential phase shifts that make the method
     # suitable for visualization only.
-    lenDiff = len(x) - len(y)
+    lenDiff = x.shape[-1] - y.shape[-1]
     frontLen = np.floor(lenDiff/2)
     backLen = lenDiff - frontLen
-    return y,frontLen,backLen
+    return _fromArray(y,axis,frame,frontLen,backLen),frontLen,backLen
+
+def _ctrmPeriods(period):
+    """Returns the three running mean windows used by CTRM."""
+    period2 = int(round(period/1.2067))
+    period3 = int(round(period2/1.2067))
+    return int(period), period2, period3
+
+def _ctrmKernel(period):
+    """
+    Builds the composite kernel of the three CTRM running means together
+    with the frontLen and backLen offsets of the cascade.
+    """
+    kernel = np.ones(1)
+    frontLen = backLen = 0
+    for window_len in _ctrmPeriods(period):
+        kernel = np.convolve(kernel, np.ones(window_len)/window_len)
+        frontLen += (window_len - 1) // 2
+        backLen += window_len - 1 - (window_len - 1) // 2
+    kernel.setflags(write=False)
+    return kernel, frontLen, backLen
+
+def CTRMKernel(period=12):
+    """
+    Returns the single kernel that is equivalent to the three cascaded running
+    means of CTRM. Kernels are cached per period.
+    Inputs:
+        period: size of window for averaging
+    Outputs:
+        kernel: 1-D ndarray of the composite weights
+        frontLen: index of where the smoothed data starts, relative to x
+        backLen: index of where the smoothed data ends, relative to the end of x
+    """
+    return _cached(_ctrmCache, (int(period),), _ctrmKernel)
 
-def CTRM(x,period=12):
+def CTRM(x,period=12,method='fused',axis=None):
     """
     Cascaded Triple Running Mean function.
     See: http://climatedatablog.wordpress.com/2014/03/15/r-code-for-simple-rss-graph/
         for the motivation and parameter selection used within.
     Inputs:
-        x: 1-D ndarray of data to be smoothed
+        x: ndarray (1-D or N-D) or DataFrame of data to be smoothed
         period: size of window for averaging
+        method: 'fused' (default) applies the composite kernel from CTRMKernel
+            in a single pass (FFT based for long kernels). 'convolve' and
+            'cumsum' run the three running means one after the other with
+            that smooth backend.
+        axis: axis along which to smooth (see smooth)
     Outputs:
-        y: 1-D ndarray of smoothed data
+        y: ndarray (or DataFrame) of smoothed data
         frontLen: index of where y's data starts, relative to x
         backLend: index of wheere y's data ends, relative to the end of x
     """
-    period2 = round(period/1.2067)
-    period3 = round(period2/1.2067)
-    newData,fl1,bl1 = smooth(x,window_len=period)
-    newData,fl2,bl2 = smooth(newData,window_len=period2)
-    newData,fl3,bl3 = smooth(newData,window_len=period3)
-    return newData, int(fl1+fl2+fl3), int(bl1+bl2+bl3)
+    x, axis, frame = _asArray(x,axis)
+    if method == 'fused':
+        kernel, frontLen, backLen = CTRMKernel(period)
+        newData = _correlateValid(x,kernel)
+    else:
+        period, period2, period3 = _ctrmPeriods(period)
+        newData,fl1,bl1 = smooth(x,window_len=period,method=method)
+        newData,fl2,bl2 = smooth(newData,window_len=period2,method=method)
+        newData,fl3,bl3 = smooth(newData,window_len=period3,method=method)
+        frontLen, backLen = int(fl1+fl2+fl3), int(bl1+bl2+bl3)
+    return _fromArray(newData,axis,frame,frontLen,backLen), frontLen, backLen
+
+def _hatMatrix(window_size,order):
+    """
+    Returns the least-squares "hat" matrix of a polynomial fit over a window.
+    Row i holds the weights that give the fitted value at sample i of the window,
+    which is exactly pinv(b)[0] for a Vandermonde matrix b centred on sample i.
+    The abscissa is centred and scaled before the QR decomposition to keep the
+    problem well conditioned for long windows.
+    """
+    half_window = (window_size - 1) / 2.0
+    k = np.arange(window_size) - half_window
+    if half_window > 0:
+        k /= half_window
+    b = np.vander(k, order+1, increasing=True)
+    q = np.linalg.qr(b)[0]
+    return np.dot(q, q.T)
+
+def _sgCoefficients(window_size,order):
+    """Builds the (centre, edges) coefficients for SavitzkyGolayCoefficients."""
+    edges = _hatMatrix(window_size,order)
+    half_window = (window_size - 1) // 2
+    if 2*half_window + 1 == window_size:
+        centre = edges[half_window].copy()
+    else:
+        # even windows use the largest odd window for the middle
+        centre = _hatMatrix(2*half_window+1,order)[half_window]
+    centre.setflags(write=False)
+    edges.setflags(write=False)
+    return centre, edges
+
+def SavitzkyGolayCoefficients(window_size,order=3):
+    """
+    Returns the Savitzky-Golay smoothing coefficients for a window size and order.
+    Results are cached (least recently used entries are evicted first).
+    Inputs:
+        window_size: a positive integer of the window size to use in smoothing
+        order: the order of the smoothing polynomial (default 3)
+    Outputs:
+        centre: 1-D ndarray of the symmetric kernel used away from the ends
+        edges: 2-D ndarray (window_size x window_size); row i holds the weights
+            for sample i of a window that is pinned to one end of the data
+    """
+    return _cached(_sgCache, (int(window_size), int(order)), _sgCoefficients)
+
+def _sgFilt(y,window_size,order):
+    """Single Savitzky-Golay pass along the last axis of the float ndarray y."""
+    centre, edges = SavitzkyGolayCoefficients(window_size,order)
+    # we want to use the same window size, but vary it to the left or right as we get 
+    # close to the edges
+    half_window = (window_size -1) // 2
+    middle = y.shape[-1] - 2*half_window
+    out = np.empty(y.shape[:-1] + (half_window + middle + window_size - half_window - 1,))
+    # both ends are a single (half_window x window) matrix product
+    out[...,:half_window] = np.dot(y[...,:window_size], edges[:half_window].T)
+    # now do the easy middle
+    out[...,half_window:half_window+middle] = _correlateValid(y,centre)
+    # do the end
+    out[...,half_window+middle:] = np.dot(y[...,-window_size:], edges[half_window+1:].T)
+    return out
 
 # http://wiki.scipy.org/Cookbook/SavitzkyGolay
 # also based on the default settings for the R SG filter
 # no derivatives. Modified to not need to mirror data at the ends
-def SavitzkyGolayFilt(x,window_size,order=3):
+def SavitzkyGolayFilt(x,window_size,order=3,axis=None):
     """
     Implements a single-pass Savitzky-Golay Filter.
     Code based on: http://wiki.scipy.org/Cookbook/SavitzkyGolay
@@ -69,153 +355,661 @@ def SavitzkyGolayFilt(x,window_size,order=3):
     size and shifts the number of left and right-hand points in the polynomial fitting
     based on where the smoothing is occurring.
     This version also does not compute any derivatives (pure smoothing)
+    The filter coefficients come from SavitzkyGolayCoefficients, so they are
+    only computed once per window size and order. Windows longer than 128
+    samples are applied through an FFT, except on series with NaN or inf
+    samples, which are convolved directly so only the windows containing
+    them are affected.
     
     Inputs:
-        x: 1-D ndarray of data to smooth
+        x: ndarray (1-D or N-D) or DataFrame of data to smooth
         window_size: an odd, positive integer of the window size to use in smoothing
         order: the order of the smoothing polynomial (default 3)
+        axis: axis along which to smooth; every other axis indexes a separate
+            series. Defaults to the last axis, or to the rows of a DataFrame
+            (each column is one series).
     Outputs:
-        y: 1-D ndarray of smoothed data
+        y: ndarray (or DataFrame) of smoothed data
             This array is the same size as x
     """
-    if isinstance(x,pd.Series):
-        y = np.array(x.tolist())
-    else:
-        y = x.copy()
-    order_range = range(order+1)
-    # we want to use the same window size, but vary it to the left or right as we get 
-    # close to the edges
-    yDummy = []
-    half_window = (window_size -1) // 2
-    for i in range(half_window):
-        b = np.mat([[k**i for i in order_range] for k in range(-i, (window_size-i))])
-        m = np.linalg.pinv(b).A[0] * factorial(0)
-        v = np.convolve(m[::-1], y[:window_size], mode='valid')
-        yDummy.extend(v)
-    # now do the easy middle
-    b = np.mat([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
-    m = np.linalg.pinv(b).A[0] * factorial(0)
-    v = np.convolve( m[::-1], y, mode='valid')
-    yDummy.extend(v)
-    # do the end
-    for i in range(half_window+1,window_size):
-        b = np.mat([[k**i for i in order_range] for k in range(-i, window_size-i)])
-        m = np.linalg.pinv(b).A[0] * factorial(0)
-        v = np.convolve(m[::-1], y[-window_size:], mode='valid')
-        yDummy.extend(v)
-    return np.array(yDummy)
+    y, axis, frame = _asArray(x,axis)
+    return _fromArray(_sgFilt(y,window_size,order),axis,frame)
 
-def SavitzkyGolay(x,period=12,order=3):
+def SavitzkyGolay(x,period=12,order=3,axis=None):
     """
     Implements a 5-pass Savitzky-Golay filter
     Based on: http://climatedatablog.wordpress.com/2014/03/15/r-code-for-simple-rss-graph/
     Inputs:
-        x: 1-D ndarray of data to smooth
+        x: ndarray (1-D or N-D) or DataFrame of data to smooth
         period: a positive integer of the window size to use in smoothing
         order: the order of the smoothing polynomial (default 3)
+        axis: axis along which to smooth (see SavitzkyGolayFilt)
     Outputs:
-        y: 1-D ndarray of smoothed data
+        y: ndarray (or DataFrame) of smoothed data
             This array is the same size as x
     """
+    data, axis, frame = _asArray(x,axis)
     f1 = period * 2 + 1
-    data = SavitzkyGolayFilt(x,f1,order)
-    data = SavitzkyGolayFilt(data,f1,order)
-    data = SavitzkyGolayFilt(data,f1,order)
-    data = SavitzkyGolayFilt(data,f1,order)
-    data = SavitzkyGolayFilt(data,f1,order)
-    return data
+    data = _sgFilt(data,f1,order)
+    data = _sgFilt(data,f1,order)
+    data = _sgFilt(data,f1,order)
+    data = _sgFilt(data,f1,order)
+    data = _sgFilt(data,f1,order)
+    return _fromArray(data,axis,frame)
     
+# Process-pool driver for datasets with many series. The data are shared with
+# the workers through shared memory (or the memory-mapped file they already
+# live in), so only small descriptors are pickled.
+def _shareArray(shape,dtype):
+    """Creates a shared memory block holding an ndarray; returns (shm, array, desc)."""
+    from multiprocessing import shared_memory
+    nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, array, ('shm', shm.name, shape, np.dtype(dtype).str, 0)
+
+def _describeArray(y):
+    """Returns a descriptor for y if the workers can map it without a copy."""
+    if not (isinstance(y,np.memmap) and y.flags.c_contiguous):
+        return None
+    base = y
+    while isinstance(base.base,np.memmap):
+        base = base.base
+    # copies (e.g. from reshaping a transposed memmap) are not backed by the file
+    if not isinstance(base.base,mmap.mmap):
+        return None
+    offset = base.offset + (y.__array_interface__['data'][0] -
+                            base.__array_interface__['data'][0])
+    return ('memmap', base.filename, y.shape, y.dtype.str, offset)
+
+def _attachArray(desc,mode='r+'):
+    """Maps an array descriptor inside a worker; returns (handle, array)."""
+    kind, name, shape, dtype, offset = desc
+    if kind == 'memmap':
+        return None, np.memmap(name, dtype=dtype, mode=mode, offset=offset, shape=shape)
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _smoothChunk(func,kwargs,src,dst,start,stop):
+    """Worker task: filters series start:stop of src into dst."""
+    srcHandle, y = _attachArray(src,'r')
+    dstHandle, out = _attachArray(dst)
+    try:
+        _smoothRows(func,kwargs,y,out,start,stop)
+    finally:
+        del y, out
+        for handle in (srcHandle, dstHandle):
+            if handle is not None:
+                handle.close()
+
+def _smoothRows(func,kwargs,y,out,start,stop):
+    """Filters series start:stop of the 2-D array y (one series per row) into out."""
+    result = func(y[start:stop],axis=-1,**kwargs)
+    if isinstance(result,tuple):
+        result = result[0]
+    out[start:stop] = result
+
+# default amount of float64 input per parallelSmooth task
+_CHUNK_BYTES = 2**20
+
+def parallelSmooth(func,x,axis=-1,workers=None,chunkSize=None,out=None,**kwargs):
+    """
+    Applies one of the smoothing functions to every series of a large N-D array,
+    splitting the series into chunks that run on a process pool.
+    Inputs:
+        func: smooth, CTRM, SavitzkyGolayFilt or SavitzkyGolay (or any module
+            level function with the same calling convention)
+        x: ndarray or np.memmap of data to be smoothed
+        axis: axis along which to smooth; every other axis indexes a series
+        workers: number of worker processes (default: os.cpu_count()).
+            0 or 1 runs the same chunks one after the other in this process.
+            The output is bit-for-bit the same for any number of workers.
+        chunkSize: number of series per task (default: as many as fit in
+            _CHUNK_BYTES). It does not depend on workers, because the FFT and
+            matrix products round differently for different numbers of series.
+        out: optional file name; the result is then written to (and returned
+            as) a memory-mapped array instead of being held in memory
+        **kwargs: passed on to func (e.g. period, order, window_len)
+    Outputs:
+        The same as func: the smoothed ndarray, followed by frontLen and backLen
+        for the running mean filters.
+    """
+    x = np.asanyarray(x)
+    axis = axis % x.ndim
+    moved = np.moveaxis(x,axis,-1)
+    shape = moved.shape
+    n = shape[-1]
+    m = int(np.prod(shape[:-1]))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunkSize is None:
+        chunkSize = max(1, _CHUNK_BYTES // (8*max(n,1)))
+    y = moved.reshape(m,n) if m else moved.reshape(0,n)
+    # one series tells us the output length (and the offsets of CTRM/smooth)
+    probe = func(np.asarray(y[:1],dtype=float),axis=-1,**kwargs)
+    extra = probe[1:] if isinstance(probe,tuple) else None
+    nOut = (probe[0] if extra is not None else probe).shape[-1]
+    chunks = [(start, min(start+chunkSize,m)) for start in range(0,m,chunkSize)]
+
+    handles = []
+    try:
+        if out is not None:
+            result = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=(m,nOut))
+        if workers <= 1 or len(chunks) <= 1:
+            if out is None:
+                result = np.empty((m,nOut))
+            for start, stop in chunks:
+                _smoothRows(func,kwargs,y,result,start,stop)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            src = _describeArray(y)
+            if src is None:
+                shm, shared, src = _shareArray((m,n),float)
+                handles.append(shm)
+                shared[...] = y
+                del shared
+            if out is None:
+                shm, result, dst = _shareArray((m,nOut),float)
+                handles.append(shm)
+            else:
+                result.flush()
+                dst = ('memmap', out, (m,nOut), result.dtype.str, result.offset)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                tasks = [pool.submit(_smoothChunk,func,kwargs,src,dst,start,stop)
+                         for start, stop in chunks]
+                for task in tasks:
+                    task.result()
+            if out is None:
+                result = result.copy()
+        if out is not None:
+            result.flush()
+    finally:
+        for shm in handles:
+            try:
+                shm.close()
+            except BufferError:
+                # a failed run can leave views of the block alive
+                pass
+            shm.unlink()
+    result = np.moveaxis(result.reshape(shape[:-1] + (nOut,)),-1,axis)
+    if extra is not None:
+        return (result,) + tuple(extra)
+    return result
+
+# Streaming versions of the filters for series that grow at the end (e.g. a new
+# monthly value). They keep a bounded amount of history and only compute what
+# the new samples change.
+class StreamingCTRM(object):
+    """
+    Incremental Cascaded Triple Running Mean.
+    CTRM output does not depend on the ends of the data, so every value is
+    final as soon as its window is complete. Only the last len(kernel) - 1
+    samples are kept.
+    Example:
+        stream = StreamingCTRM(period=12)
+        y = stream.extend(history)
+        y = np.append(y, stream.push(newValue))
+        # y equals CTRM(np.append(history, newValue), period=12)[0]
+    Attributes:
+        frontLen: index of where the first output starts, relative to the input
+        count: number of samples received so far
+        emitted: number of smoothed values returned so far
+    """
+    def __init__(self,period=12):
+        self.kernel, self.frontLen, self.backLen = CTRMKernel(period)
+        self._tail = np.empty(0)
+        self.count = 0
+        self.emitted = 0
+
+    def extend(self,values):
+        """Adds samples; returns the newly finalized smoothed values."""
+        data = np.concatenate((self._tail, np.asarray(values,dtype=float).ravel()))
+        self.count += len(data) - len(self._tail)
+        keep = len(self.kernel) - 1
+        self._tail = data[max(0,len(data)-keep):] if keep else data[:0]
+        if len(data) < len(self.kernel):
+            return np.empty(0)
+        out = _correlateValid(data,self.kernel)
+        self.emitted += len(out)
+        return out
+
+    def push(self,value):
+        """Adds one sample; returns the newly finalized smoothed values."""
+        return self.extend([value])
+
+class _StreamingSGPass(object):
+    """
+    One incremental Savitzky-Golay pass. Output i is final once the window
+    around it is complete, i.e. once i + half_window samples have arrived; the
+    last half_window outputs use the asymmetric end window and are provisional.
+    Only the last window_size final inputs are kept.
+    """
+    def __init__(self,window_size,order):
+        self.window_size = window_size
+        self.order = order
+        self.half_window = (window_size - 1) // 2
+        self._tail = np.empty(0)
+        self.count = 0
+        self.emitted = 0
+
+    def _filter(self,data,start):
+        """Filters the tail plus data; returns the outputs from position start on."""
+        seg = np.concatenate((self._tail, data))
+        if self.count - len(self._tail) + len(seg) < self.window_size:
+            return None, seg
+        # the tail reaches back a whole window, so outputs at start and later
+        # never fall in the leading edge of seg unless seg starts at sample 0
+        offset = self.count - len(self._tail)
+        return _sgFilt(seg,self.window_size,self.order)[start-offset:], seg
+
+    def extend(self,values):
+        """Adds final input samples; returns the newly finalized outputs."""
+        values = np.asarray(values,dtype=float)
+        out, seg = self._filter(values,self.emitted)
+        self.count += len(values)
+        self._tail = seg[-self.window_size:]
+        if out is None:
+            return np.empty(0)
+        out = out[:len(out)-self.half_window]
+        self.emitted += len(out)
+        return out
+
+    def provisional(self,pending):
+        """
+        Returns the outputs that are not final yet, given the provisional
+        outputs of the previous pass.
+        """
+        out = self._filter(np.asarray(pending,dtype=float),self.emitted)[0]
+        return np.empty(0) if out is None else out
+
+class StreamingSavitzkyGolay(object):
+    """
+    Incremental 5-pass Savitzky-Golay filter (see SavitzkyGolay).
+    extend() and push() return the smoothed values that no longer change when
+    more data arrive. The remaining values near the end depend on the
+    asymmetric end windows; provisional() computes them on demand from the
+    retained samples only. The values returned so far followed by
+    provisional() equal SavitzkyGolay() of the whole history (to rounding).
+    Each pass keeps window_size samples, so memory does not grow with the
+    history.
+    Example:
+        stream = StreamingSavitzkyGolay(period=12)
+        final = stream.extend(history)
+        final = np.append(final, stream.push(newValue))
+        y = np.append(final, stream.provisional())
+    """
+    def __init__(self,period=12,order=3):
+        window_size = period * 2 + 1
+        self._passes = [_StreamingSGPass(window_size,order) for i in range(5)]
+        self.count = 0
+        self.emitted = 0
+
+    def extend(self,values):
+        """Adds samples; returns the newly finalized smoothed values."""
+        out = np.asarray(values,dtype=float).ravel()
+        self.count += len(out)
+        for sgPass in self._passes:
+            out = sgPass.extend(out)
+        self.emitted += len(out)
+        return out
+
+    def push(self,value):
+        """Adds one sample; returns the newly finalized smoothed values."""
+        return self.extend([value])
+
+    def provisional(self):
+        """Returns the smoothed values after the finalized ones, as of now."""
+        pending = np.empty(0)
+        for sgPass in self._passes:
+            pending = sgPass.provisional(pending)
+        return pending
+
+# Plot-time decimation: dense series are reduced to about one bucket per pixel
+# before they are drawn, keeping the extremes that would be visible.
+def _firstPerSegment(mask,seg):
+    """Index of the first True of mask in every segment (seg is sorted)."""
+    hits = np.flatnonzero(mask)
+    segs = seg[hits]
+    return hits[np.r_[True, segs[1:] != segs[:-1]]]
+
+def _minMaxIndices(x,y,buckets,lo,hi):
+    # bucket of every sample; samples just outside [lo, hi] go to the end buckets
+    edges = np.linspace(lo,hi,buckets+1)
+    ids = np.clip(np.searchsorted(edges,x,side='right')-1,0,buckets-1)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(y)]
+    seg = np.repeat(np.arange(len(starts)), ends - starts)
+    iMin = _firstPerSegment(y == np.minimum.reduceat(y,starts)[seg], seg)
+    iMax = _firstPerSegment(y == np.maximum.reduceat(y,starts)[seg], seg)
+    # the first and last sample of a bucket keep lines between buckets in place
+    return np.unique(np.concatenate((starts, ends-1, iMin, iMax)))
+
+def _lttbIndices(x,y,buckets):
+    # largest-triangle-three-buckets: one sample per bucket, the one spanning the
+    # largest triangle with the previous choice and the mean of the next bucket
+    n = len(x)
+    edges = np.linspace(1,n-1,buckets-1).astype(int)
+    keep = np.empty(buckets,dtype=int)
+    keep[0], keep[-1] = 0, n-1
+    for i in range(buckets-2):
+        start, stop = edges[i], edges[i+1]
+        nextStop = edges[i+2] if i+2 < len(edges) else n
+        nx, ny = x[stop:nextStop].mean(), y[stop:nextStop].mean()
+        px, py = x[keep[i]], y[keep[i]]
+        area = np.abs((px - nx)*(y[start:stop] - py) - (px - x[start:stop])*(ny - py))
+        keep[i+1] = start + np.argmax(area)
+    return keep
+
+def decimate(x,y,buckets,xlim=None,method='minmax'):
+    """
+    Reduces a series to what can be seen at a given resolution before plotting.
+    Inputs:
+        x: sorted 1-D array (or Series) of x values, such as dates
+        y: 1-D array (or Series) of y values
+        buckets: number of buckets across xlim, about its width in pixels
+        xlim: (lo, hi) x range that will be visible (default: all of x). Only
+            the samples in it, and one on each side, are kept.
+        method: 'minmax' keeps the first, last, lowest and highest sample of
+            every bucket, so the extremes and the outline of lines and point
+            clouds stay where they were. 'lttb' keeps one sample per bucket
+            (largest-triangle-three-buckets), which follows the shape of a line
+            with fewer points but may drop single outliers.
+    Outputs:
+        x, y: the kept samples as arrays, unchanged when there are no more than
+            two samples per bucket
+    Example:
+        ax.plot(*decimate(df.Date,df.Anomaly,1500,xlim=(1977,2015)))
+    """
+    x = np.asarray(x,dtype=float)
+    y = np.asarray(y,dtype=float)
+    if xlim is not None:
+        lo, hi = xlim
+        first = max(np.searchsorted(x,lo,side='left')-1,0)
+        last = min(np.searchsorted(x,hi,side='right')+1,len(x))
+        x, y = x[first:last], y[first:last]
+    else:
+        lo, hi = (x[0], x[-1]) if len(x) else (0.0, 1.0)
+    finite = np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    buckets = int(buckets)
+    if len(x) <= 2*buckets or buckets < 3:
+        return x, y
+    if method == 'minmax':
+        keep = _minMaxIndices(x,y,buckets,lo,hi)
+    elif method == 'lttb':
+        keep = _lttbIndices(x,y,buckets)
+    else:
+        raise ValueError("method must be 'minmax' or 'lttb', not %r" % (method,))
+    return x[keep], y[keep]
+
+def _thin(x,y,buckets,xlim,method):
+    """decimate(), or x and y as they are when method is None."""
+    if method is None:
+        return x, y
+    return decimate(x,y,buckets,xlim,method)
+
 # do the actual smoothing for RSS and HadCrut4 data types
-# load the data
-dataLoc = "http://data.remss.com/msu/graphics/TLT/time_series/RSS_TS_channel_TLT_Global_Land_And_Sea_v03_3.txt"
-df = pd.read_table(dataLoc,sep="\s+",skiprows=5,header=None,names=["Year","Month","Anomaly"])
-#dataLoc = "CTRM.csv"
-#df = pd.read_csv(dataLoc)
-# remove anomalies
-df = df[df.Anomaly != -99.9]
-df = df.reset_index(drop=True)
-# make the date a decimal year
-df["Date"] = df.Year + df.Month/12.0 - 1/24
-# make the smoothed data
-# CTRM at different periods
-yr1LP,s1,e1 = CTRM(df.Anomaly,period=12)
-yr5LP,s5,e5 = CTRM(df.Anomaly,period=12*5)
-# S-G filter data
-newData2 = SavitzkyGolay(df.Anomaly,period=12)
-
-# Plot the data
-fig = pylab.figure(figsize=(15,7))
-ax = fig.add_subplot(111,axisbg="white")
-# the data
-ax.scatter(df.Date,df.Anomaly,s=15,marker='o',facecolor="1.0",lw=0.5,edgecolor="0.0")
-ax.plot(df.Date[s1:-e1],yr1LP,'-y',label='Annual LP')
-ax.plot(df.Date[s5:-e5],yr5LP,'-k',label='>5 yr LP')
-ax.plot(df.Date,newData2,'-b',label='Annual SG',lw=1)
-
-# plot formatting
-ax.minorticks_on()
-ax.grid(b=True,which="minor",axis='x')
-ax.grid(b=False,which="minor",axis='y')
-ax.set_xlim(1977,2015)
-ax.set_xlabel("Year")
-legend = ax.legend(loc=4)
-legend.get_frame().set_facecolor("white")
-ax.set_title("RSS Monthly Anomaly Smoothing by CTRM and Savitsky-Golay")
-ax.set_ylabel("Anomaly")
-pylab.show()
-
-# HadCrut4 Data
-# load the data
-dataLoc = "http://www.metoffice.gov.uk/hadobs/hadcrut4/data/current/time_series/HadCRUT.4.2.0.0.monthly_ns_avg.txt"
-# for some reason, usecols doesn't work not in IPython, so we name the columns to make sure that they work
-df2 = pd.read_table(dataLoc,sep="\s+",header=None)
-df2.rename(columns={0:"Year",1:"Anomaly"}, inplace=True)
-# make the date a decimal year
-df2["Date"] = df2["Year"].map(lambda x: eval(x[:4] + "+" + str(int(x[-2:])) + "/12.0 - 1/24.0"))
-
-# make the CTRM data
-yr1LP2,s12,e12 = CTRM(df2.Anomaly,period=12)
-yr15LP2,s152,e152 = CTRM(df2.Anomaly,period=12*15)
-yr75LP2,s752,e752 = CTRM(df2.Anomaly,period=12*30)
-# make S-G filter data
-yr15SG2 = SavitzkyGolay(df2.Anomaly,period=12*15)
-
-# plot the data
-fig = pylab.figure(figsize=(15,7))
-ax = fig.add_subplot(111, axisbg='white')
-ax.scatter(df2.Date,df2.Anomaly,s=15,marker='o',facecolor="1.0",lw=0.5,edgecolor="0.0")
-ax.plot(df2.Date[s12:-e12],yr1LP2,'-y',label='Annual LP')
-ax.plot(df2.Date[s152:-e152],yr15LP2,'-g',label='>15 yr LP')
-ax.plot(df2.Date[s752:-e752],yr75LP2,'-b',label='>30 yr LP')
-ax.plot(df2.Date,yr15SG2,'--r',label='S-G 15 yr')
-
-# formatting the plot
-ax.xaxis.set_minor_locator(pylab.MultipleLocator(5))
-ax.yaxis.set_minor_locator(pylab.MultipleLocator(0.1))
-ax.grid(b=True,which="minor",axis='x')
-ax.grid(b=True,which="minor",axis='y')
-ax.set_xticks(range(1850,2030,10))
-ax.set_xlim(1843,2021)
-ax.set_ylim(-1.03,0.89)
-ax.set_xlabel("Year")
-legend = ax.legend(loc="upper left",fontsize=14)
-frame = legend.get_frame()
-frame.set_facecolor('1.0')
-ax.set_ylabel("Anomaly")
-
-# adding an inset axis to view the downturn at the end better
-inset_axes = zoomed_inset_axes(ax, 3, loc=4)
-inset_axes.scatter(df2.Date,df2.Anomaly,s=15,marker='o',facecolor="1.0",lw=0.5,edgecolor="0.0")
-inset_axes.plot(df2.Date[s12:-e12],yr1LP2,'-y',label='Annual LP')
-inset_axes.plot(df2.Date[s152:-e152],yr15LP2,'-g',label='>15 yr LP')
-inset_axes.plot(df2.Date[s752:-e752],yr75LP2,'-b',label='>30 yr LP')
-inset_axes.plot(df2.Date,yr15SG2,'--r',label='S-G 15 yr')
-x1, x2, y1, y2 = 2000, 2015, 0.3, 0.6
-inset_axes.set_xlim(x1, x2)
-inset_axes.set_ylim(y1, y2)
-inset_axes.set_xticks([])
-inset_axes.set_yticks([])
-inset_axes.set_axis_bgcolor("1.0")
-ax.set_title("HadCrut4 Monthly Anomaly Smoothing by CTRM and Savitsky-Golay")
-mark_inset(ax, inset_axes, loc1=1, loc2=2, fc="none", ec="0.0");
-pylab.show()
+# downloaded data are reused for a week (see ClimateData.cachedSeries)
+CACHE_TTL = 7*24*3600
+
+def plotRSS(df=None,show=True,decimation='minmax'):
+    """
+    Plots the RSS anomalies with their CTRM and Savitzky-Golay smoothing.
+    Inputs:
+        df: DataFrame from ClimateData.loadRSS (default: the cached download)
+        show: call pylab.show() at the end
+        decimation: method of decimate() used to thin the series to the
+            resolution of the plot, or None to draw every sample
+    Outputs:
+        fig: the matplotlib figure
+    """
+    import pylab
+    if df is None:
+        from ClimateData import RSS_URL, cachedSeries, loadRSS
+        # load the data (missing anomalies are removed and the date is a decimal year)
+        df = cachedSeries(RSS_URL,loadRSS,ttl=CACHE_TTL)
+    # make the smoothed data
+    # CTRM at different periods
+    yr1LP,s1,e1 = CTRM(df.Anomaly,period=12)
+    yr5LP,s5,e5 = CTRM(df.Anomaly,period=12*5)
+    # S-G filter data
+    newData2 = SavitzkyGolay(df.Anomaly,period=12)
+
+    # Plot the data
+    fig = pylab.figure(figsize=(15,7))
+    ax = fig.add_subplot(111,axisbg="white")
+    # the series are thinned to about one bucket per pixel of the visible years
+    xlim = (1977,2015)
+    pixels = int(fig.get_figwidth()*fig.dpi)
+    thin = lambda x,y: _thin(x,y,pixels,xlim,decimation)
+    # the data
+    ax.scatter(*thin(df.Date,df.Anomaly),s=15,marker='o',facecolor="1.0",lw=0.5,edgecolor="0.0")
+    ax.plot(*thin(df.Date[s1:-e1],yr1LP),'-y',label='Annual LP')
+    ax.plot(*thin(df.Date[s5:-e5],yr5LP),'-k',label='>5 yr LP')
+    ax.plot(*thin(df.Date,newData2),'-b',label='Annual SG',lw=1)
+
+    # plot formatting
+    ax.minorticks_on()
+    ax.grid(b=True,which="minor",axis='x')
+    ax.grid(b=False,which="minor",axis='y')
+    ax.set_xlim(*xlim)
+    ax.set_xlabel("Year")
+    legend = ax.legend(loc=4)
+    legend.get_frame().set_facecolor("white")
+    ax.set_title("RSS Monthly Anomaly Smoothing by CTRM and Savitsky-Golay")
+    ax.set_ylabel("Anomaly")
+    if show:
+        pylab.show()
+    return fig
+
+def plotHadCRUT(df2=None,show=True,decimation='minmax'):
+    """
+    Plots the HadCrut4 anomalies with their CTRM and Savitzky-Golay smoothing,
+    with an inset of the last years.
+    Inputs:
+        df2: DataFrame from ClimateData.loadHadCRUT (default: the cached download)
+        show: call pylab.show() at the end
+        decimation: method of decimate() used to thin the series to the
+            resolution of the main axes and of the inset, or None to draw
+            every sample
+    Outputs:
+        fig: the matplotlib figure
+    """
+    import pylab
+    from mpl_toolkits.axes_grid.inset_locator import zoomed_inset_axes, mark_inset
+    if df2 is None:
+        from ClimateData import HADCRUT_URL, cachedSeries, loadHadCRUT
+        # load the data
+        df2 = cachedSeries(HADCRUT_URL,loadHadCRUT,ttl=CACHE_TTL)
+
+    # make the CTRM data
+    yr1LP2,s12,e12 = CTRM(df2.Anomaly,period=12)
+    yr15LP2,s152,e152 = CTRM(df2.Anomaly,period=12*15)
+    yr75LP2,s752,e752 = CTRM(df2.Anomaly,period=12*30)
+    # make S-G filter data
+    yr15SG2 = SavitzkyGolay(df2.Anomaly,period=12*15)
+
+    # plot the data
+    fig = pylab.figure(figsize=(15,7))
+    ax = fig.add_subplot(111, axisbg='white')
+    # the series are thinned to about one bucket per pixel of the visible years,
+    # the inset (zoomed 3 times) separately over its own years
+    xlim = (1843,2021)
+    x1, x2, y1, y2 = 2000, 2015, 0.3, 0.6
+    pixels = int(fig.get_figwidth()*fig.dpi)
+    insetPixels = int(np.ceil(3*pixels*(x2 - x1)/(xlim[1] - xlim[0])))
+    series = [(df2.Date[s12:-e12],yr1LP2,'-y','Annual LP'),
+              (df2.Date[s152:-e152],yr15LP2,'-g','>15 yr LP'),
+              (df2.Date[s752:-e752],yr75LP2,'-b','>30 yr LP'),
+              (df2.Date,yr15SG2,'--r','S-G 15 yr')]
+    ax.scatter(*_thin(df2.Date,df2.Anomaly,pixels,xlim,decimation),
+               s=15,marker='o',facecolor="1.0",lw=0.5,edgecolor="0.0")
+    for x, y, style, label in series:
+        ax.plot(*_thin(x,y,pixels,xlim,decimation),style,label=label)
+
+    # formatting the plot
+    ax.xaxis.set_minor_locator(pylab.MultipleLocator(5))
+    ax.yaxis.set_minor_locator(pylab.MultipleLocator(0.1))
+    ax.grid(b=True,which="minor",axis='x')
+    ax.grid(b=True,which="minor",axis='y')
+    ax.set_xticks(range(1850,2030,10))
+    ax.set_xlim(*xlim)
+    ax.set_ylim(-1.03,0.89)
+    ax.set_xlabel("Year")
+    legend = ax.legend(loc="upper left",fontsize=14)
+    frame = legend.get_frame()
+    frame.set_facecolor('1.0')
+    ax.set_ylabel("Anomaly")
+
+    # adding an inset axis to view the downturn at the end better
+    inset_axes = zoomed_inset_axes(ax, 3, loc=4)
+    inset_axes.scatter(*_thin(df2.Date,df2.Anomaly,insetPixels,(x1,x2),decimation),
+                       s=15,marker='o',facecolor="1.0",lw=0.5,edgecolor="0.0")
+    for x, y, style, label in series:
+        inset_axes.plot(*_thin(x,y,insetPixels,(x1,x2),decimation),style,label=label)
+    inset_axes.set_xlim(x1, x2)
+    inset_axes.set_ylim(y1, y2)
+    inset_axes.set_xticks([])
+    inset_axes.set_yticks([])
+    inset_axes.set_axis_bgcolor("1.0")
+    ax.set_title("HadCrut4 Monthly Anomaly Smoothing by CTRM and Savitsky-Golay")
+    mark_inset(ax, inset_axes, loc1=1, loc2=2, fc="none", ec="0.0");
+    if show:
+        pylab.show()
+    return fig
+
+# Batch mode: smooth local files without plotting.
+# filter name: (function, keyword of the first setting, keyword of the second)
+BATCH_FILTERS = OrderedDict([
+    ("smooth", (smooth, "window_len", None)),
+    ("CTRM", (CTRM, "period", None)),
+    ("SavitzkyGolay", (SavitzkyGolay, "period", "order")),
+])
+BATCH_DEFAULTS = ("CTRM:12", "CTRM:60", "SavitzkyGolay:12")
+
+def _parseFilter(spec):
+    """Turns "name:setting[:setting]" (e.g. "SavitzkyGolay:12:3") into (name, func, kwargs)."""
+    parts = spec.split(":")
+    if parts[0] not in BATCH_FILTERS or not 2 <= len(parts) <= 3:
+        raise ValueError("filters are given as name:setting, with name one of %s; got %r"
+                         % (", ".join(BATCH_FILTERS), spec))
+    func, first, second = BATCH_FILTERS[parts[0]]
+    if len(parts) == 3 and second is None:
+        raise ValueError("%s takes one setting; got %r" % (parts[0], spec))
+    try:
+        settings = [int(part) for part in parts[1:]]
+    except ValueError:
+        raise ValueError("filter settings must be integers; got %r" % spec)
+    kwargs = {first: settings[0]}
+    if len(settings) == 2:
+        kwargs[second] = settings[1]
+    return spec.replace(":","_"), func, kwargs
+
+def _kernelLength(func,kwargs):
+    """Number of samples a batch filter needs for one smoothed value."""
+    if func is smooth:
+        return kwargs["window_len"]
+    if func is CTRM:
+        return len(CTRMKernel(kwargs["period"])[0])
+    return 2*kwargs["period"] + 1
+
+def _checkLength(n,filters,source="the series"):
+    """Raises ValueError if a filter needs more than the n samples of source."""
+    for spec in filters:
+        name, func, kwargs = _parseFilter(spec)
+        length = _kernelLength(func,kwargs)
+        if n < length:
+            raise ValueError("%s needs at least %d samples but %s has %d"
+                             % (spec, length, source, n))
+
+def smoothColumns(x,filters=BATCH_DEFAULTS):
+    """
+    Applies several filters to one series and lines the results up with it.
+    Inputs:
+        x: 1-D array of data
+        filters: sequence of "name:setting[:setting]" strings, see BATCH_FILTERS.
+            ValueError is raised if x is shorter than one of their windows.
+    Outputs:
+        columns: OrderedDict of column name (e.g. "CTRM_12") to an array as long
+            as x, NaN where a running mean filter has no value
+    """
+    x = np.asarray(x,dtype=float)
+    _checkLength(len(x),filters)
+    columns = OrderedDict()
+    for spec in filters:
+        name, func, kwargs = _parseFilter(spec)
+        out = func(x,**kwargs)
+        column = np.full(len(x),np.nan)
+        if isinstance(out,tuple):
+            y, frontLen, backLen = out
+            column[int(frontLen):len(x)-int(backLen)] = y
+        else:
+            column[:] = out
+        columns[name] = column
+    return columns
+
+def batch(inputs,filters=BATCH_DEFAULTS,kind="series",outputDir=None):
+    """
+    Smooths local anomaly files and writes one CSV per file with the Date, the
+    Anomaly and a column per filter (see smoothColumns). Nothing is downloaded
+    or plotted.
+    Inputs:
+        inputs: file names
+        filters: see smoothColumns
+        kind: "rss", "hadcrut" or "series" (ClimateData.loadSeries defaults)
+        outputDir: directory of the results (default: next to each input),
+            named like the input with a "_smoothed.csv" ending
+    Outputs:
+        outputs: the names of the files written
+    """
+    import ClimateData
+    loader = {"rss": ClimateData.loadRSS, "hadcrut": ClimateData.loadHadCRUT,
+              "series": ClimateData.loadSeries}[kind]
+    # check the filters before any file is read
+    for spec in filters:
+        _parseFilter(spec)
+    outputs = []
+    for name in inputs:
+        df = loader(name)
+        _checkLength(len(df),filters,name)
+        result = df[["Date","Anomaly"]].copy()
+        for column, values in smoothColumns(df.Anomaly,filters).items():
+            result[column] = values
+        stem = os.path.splitext(os.path.basename(name))[0]
+        out = os.path.join(outputDir or os.path.dirname(name), stem + "_smoothed.csv")
+        result.to_csv(out,index=False)
+        outputs.append(out)
+    return outputs
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Smooth climate anomaly series. Without input files the RSS "
+                    "and HadCrut4 plots are shown; with input files they are "
+                    "smoothed to CSV without plotting.")
+    parser.add_argument("inputs", nargs="*", help="local anomaly files to smooth")
+    parser.add_argument("--kind", choices=("rss","hadcrut","series"), default="series",
+                        help="layout of the input files")
+    parser.add_argument("--filters", nargs="+", default=list(BATCH_DEFAULTS),
+                        help="filters as name:setting[:setting], from %s"
+                             % ", ".join(BATCH_FILTERS))
+    parser.add_argument("--output-dir", help="directory of the results")
+    args = parser.parse_args(argv)
+    if not args.inputs:
+        plotRSS()
+        plotHadCRUT()
+        return 0
+    try:
+        for spec in args.filters:
+            _parseFilter(spec)
+    except ValueError as e:
+        parser.error(str(e))
+    outputs = batch(args.inputs,args.filters,args.kind,args.output_dir)
+    for out in outputs:
+        print(out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+# benchmark the ClimateSmoothing filters
+# Sweeps series length, window and polynomial order over synthetic data, records
+# wall time, peak memory and throughput, and checks the filters against the
+# original implementations so that speedups cannot change their output. The
+# checks also time a cold import of ClimateSmoothing against IMPORT_TARGET.
+#
+# Usage:
+#     python ClimateSmoothingBenchmark.py --output results.json
+#     python ClimateSmoothingBenchmark.py --baseline results.json --output new.json
+from __future__ import division
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import ClimateSmoothing as cs
+
+LENGTHS = (10**3, 10**4, 10**5, 10**6, 10**7)
+PERIODS = (12, 12*5, 12*15, 12*30)
+ORDERS = (2, 3, 4)
+# seconds a fresh interpreter may take to import ClimateSmoothing
+IMPORT_TARGET = 0.5
+# modules that importing the filters must not pull in
+LAZY_MODULES = ("pandas", "matplotlib", "ClimateData")
+
+# Reference versions of the filters as they were first written (np.mat replaced
+# by plain arrays). They are slow and only used for the equivalence checks.
+def referenceSmooth(x,window_len=12):
+    w=np.ones(window_len,'d')
+    y=np.convolve(x,w/w.sum(),mode='valid')
+    lenDiff = len(x) - len(y)
+    frontLen = np.floor(lenDiff/2)
+    backLen = lenDiff - frontLen
+    return y,frontLen,backLen
+
+def referenceCTRM(x,period=12):
+    period2 = int(round(period/1.2067))
+    period3 = int(round(period2/1.2067))
+    newData,fl1,bl1 = referenceSmooth(x,window_len=period)
+    newData,fl2,bl2 = referenceSmooth(newData,window_len=period2)
+    newData,fl3,bl3 = referenceSmooth(newData,window_len=period3)
+    return newData, int(fl1+fl2+fl3), int(bl1+bl2+bl3)
+
+def referenceSavitzkyGolayFilt(x,window_size,order=3):
+    y = np.array(x,dtype=float)
+    order_range = range(order+1)
+    yDummy = []
+    half_window = (window_size -1) // 2
+    for i in range(half_window):
+        b = np.array([[k**i for i in order_range] for k in range(-i, (window_size-i))],dtype=float)
+        m = np.linalg.pinv(b)[0]
+        yDummy.extend(np.convolve(m[::-1], y[:window_size], mode='valid'))
+    b = np.array([[k**i for i in order_range] for k in range(-half_window, half_window+1)],dtype=float)
+    m = np.linalg.pinv(b)[0]
+    yDummy.extend(np.convolve(m[::-1], y, mode='valid'))
+    for i in range(half_window+1,window_size):
+        b = np.array([[k**i for i in order_range] for k in range(-i, window_size-i)],dtype=float)
+        m = np.linalg.pinv(b)[0]
+        yDummy.extend(np.convolve(m[::-1], y[-window_size:], mode='valid'))
+    return np.array(yDummy)
+
+def referenceSavitzkyGolay(x,period=12,order=3):
+    f1 = period * 2 + 1
+    data = x
+    for i in range(5):
+        data = referenceSavitzkyGolayFilt(data,f1,order)
+    return data
+
+# name: (filter under test, reference, whether it uses the order)
+FILTERS = {
+    "smooth": (lambda x,p,o: cs.smooth(x,window_len=p),
+               lambda x,p,o: referenceSmooth(x,window_len=p), False),
+    "smooth-cumsum": (lambda x,p,o: cs.smooth(x,window_len=p,method='cumsum'),
+                      lambda x,p,o: referenceSmooth(x,window_len=p), False),
+    "CTRM": (lambda x,p,o: cs.CTRM(x,period=p),
+             lambda x,p,o: referenceCTRM(x,period=p), False),
+    "CTRM-convolve": (lambda x,p,o: cs.CTRM(x,period=p,method='convolve'),
+                      lambda x,p,o: referenceCTRM(x,period=p), False),
+    "CTRM-cumsum": (lambda x,p,o: cs.CTRM(x,period=p,method='cumsum'),
+                    lambda x,p,o: referenceCTRM(x,period=p), False),
+    "SavitzkyGolayFilt": (lambda x,p,o: cs.SavitzkyGolayFilt(x,2*p+1,o),
+                          lambda x,p,o: referenceSavitzkyGolayFilt(x,2*p+1,o), True),
+    "SavitzkyGolay": (lambda x,p,o: cs.SavitzkyGolay(x,period=p,order=o),
+                      lambda x,p,o: referenceSavitzkyGolay(x,period=p,order=o), True),
+}
+
+def syntheticSeries(n,seed=0):
+    """Monthly-like anomaly series: trend, annual cycle, red and white noise."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(n) / 12.0
+    noise = np.cumsum(rng.normal(0, 0.02, n))
+    noise -= np.linspace(0, noise[-1], n)
+    return 0.01*t + 0.1*np.sin(2*np.pi*t) + noise + rng.normal(0, 0.1, n)
+
+def _cases(filters,lengths,periods,orders):
+    for name in filters:
+        usesOrder = FILTERS[name][2]
+        for n in lengths:
+            for period in periods:
+                # the Savitzky-Golay filters need at least one full window
+                if n < 4*period + 2:
+                    continue
+                for order in (orders if usesOrder else (None,)):
+                    yield name, n, period, order
+
+def measure(func,repeat=3):
+    """
+    Runs func repeat times.
+    Outputs:
+        seconds: fastest wall time
+        peakBytes: peak memory allocated by the call (tracemalloc, first run)
+    """
+    tracemalloc.start()
+    try:
+        func()
+        peakBytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    seconds = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds, peakBytes
+
+def runBenchmarks(filters=None,lengths=LENGTHS,periods=PERIODS,orders=ORDERS,repeat=3,verbose=True):
+    """Returns one result dict per (filter, length, period, order) combination."""
+    results = []
+    data = {}
+    for name, n, period, order in _cases(filters or sorted(FILTERS),lengths,periods,orders):
+        if n not in data:
+            data[n] = syntheticSeries(n)
+        x = data[n]
+        func = FILTERS[name][0]
+        seconds, peakBytes = measure(lambda: func(x,period,order or 3),repeat)
+        result = {"filter": name, "length": n, "period": period, "order": order,
+                  "seconds": seconds, "peak_bytes": peakBytes,
+                  "samples_per_sec": n / seconds if seconds > 0 else float("inf")}
+        results.append(result)
+        if verbose:
+            print("%-18s n=%-9d period=%-4d order=%-4s %10.4f s %12.0f samples/s %10.1f MB" % (
+                name, n, period, order, seconds, result["samples_per_sec"], peakBytes/2.0**20))
+    return results
+
+def _withNonFinite(x):
+    """A copy of x with a NaN and an inf sample, as in gappy station data."""
+    x = x.copy()
+    x[len(x)//3] = np.nan
+    x[2*len(x)//3] = np.inf
+    return x
+
+def _mismatch(new,old,atol=None):
+    """
+    Describes how new differs from old, or returns None when they agree.
+    NaN and inf outputs must be in the same places with the same values, the
+    finite ones within atol (relative to the largest) unless atol is None.
+    """
+    if np.shape(new) != np.shape(old):
+        return "shape %r != %r" % (np.shape(new), np.shape(old))
+    new, old = np.asarray(new), np.asarray(old)
+    finite = np.isfinite(old)
+    if (not np.array_equal(finite, np.isfinite(new)) or
+            not np.array_equal(new[~finite], old[~finite], equal_nan=True)):
+        return "%d non-finite values where the reference has %d" % (
+            np.sum(~np.isfinite(new)), np.sum(~finite))
+    if atol is not None and finite.any():
+        scale = np.abs(old[finite]).max()
+        if not np.allclose(new[finite], old[finite], rtol=0, atol=atol*scale):
+            return "max difference %g" % np.abs(new[finite] - old[finite]).max()
+    return None
+
+def checkEquivalence(filters=None,lengths=(1000,5000),periods=(12,60),orders=ORDERS,atol=1e-8,
+                     nonFinitePeriods=(12,60,180)):
+    """
+    Compares every filter against its reference implementation.
+    Clean series are checked at periods. Series with a NaN and an inf sample
+    are checked at nonFinitePeriods, whose long windows go through the FFT:
+    the non-finite outputs must match the reference exactly (only the windows
+    containing those samples are affected), the finite ones within atol at
+    periods. The reference Savitzky-Golay coefficients come from pinv of an
+    unscaled Vandermonde matrix and lose about 1e-8 at 361 samples and order 4,
+    so their finite values are not compared there.
+    Outputs:
+        failures: list of strings describing mismatches (empty when all agree)
+    """
+    failures = []
+    allPeriods = sorted(set(periods) | set(nonFinitePeriods))
+    for name, n, period, order in _cases(filters or sorted(FILTERS),lengths,allPeriods,orders):
+        clean = syntheticSeries(n, seed=n)
+        runs = []
+        if period in periods:
+            runs.append(("", clean, atol))
+        if period in nonFinitePeriods:
+            runs.append((" non-finite", _withNonFinite(clean), atol if period in periods else None))
+        func, reference = FILTERS[name][:2]
+        for label, x, tolerance in runs:
+            with np.errstate(invalid="ignore"):
+                new, old = func(x,period,order or 3), reference(x,period,order or 3)
+            if isinstance(old,tuple):
+                if tuple(new[1:]) != tuple(old[1:]):
+                    failures.append("%s%s n=%d period=%d: offsets %r != %r" % (
+                        name, label, n, period, new[1:], old[1:]))
+                new, old = new[0], old[0]
+            problem = _mismatch(new,old,tolerance)
+            if problem:
+                failures.append("%s%s n=%d period=%d order=%s: %s" % (
+                    name, label, n, period, order, problem))
+    return failures
+
+def compare(results,baseline,tolerance=0.2):
+    """
+    Returns the results that are more than tolerance (fractional) slower than
+    the matching baseline result, as (result, baseline seconds) pairs.
+    """
+    key = lambda r: (r["filter"], r["length"], r["period"], r["order"])
+    before = dict((key(r), r["seconds"]) for r in baseline)
+    return [(r, before[key(r)]) for r in results
+            if key(r) in before and r["seconds"] > before[key(r)] * (1 + tolerance)]
+
+def importTime(module="ClimateSmoothing",repeat=5):
+    """
+    Imports module in fresh interpreters.
+    Outputs:
+        seconds: fastest cold import time
+        loaded: the LAZY_MODULES that the import loaded
+    """
+    code = ("import sys, time; t = time.perf_counter(); import %s; "
+            "print(time.perf_counter() - t); print(' '.join(m for m in %r if m in sys.modules))"
+            % (module, LAZY_MODULES))
+    here = os.path.dirname(os.path.abspath(__file__))
+    seconds = float("inf")
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=here,
+                                         universal_newlines=True).split("\n")
+        seconds = min(seconds, float(output[0]))
+    return seconds, output[1].split()
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ClimateSmoothing filters.")
+    parser.add_argument("--filters", nargs="+", choices=sorted(FILTERS), default=sorted(FILTERS))
+    parser.add_argument("--lengths", nargs="+", type=lambda s: int(float(s)), default=LENGTHS)
+    parser.add_argument("--periods", nargs="+", type=int, default=PERIODS)
+    parser.add_argument("--orders", nargs="+", type=int, default=ORDERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="fractional slowdown reported as a regression")
+    parser.add_argument("--skip-check", action="store_true",
+                        help="do not compare against the reference implementations")
+    parser.add_argument("--check-only", action="store_true",
+                        help="only compare against the reference implementations")
+    parser.add_argument("--import-target", type=float, default=IMPORT_TARGET,
+                        help="seconds allowed for a cold import of ClimateSmoothing")
+    args = parser.parse_args(argv)
+
+    status = 0
+    if not args.skip_check:
+        failures = checkEquivalence(args.filters, orders=args.orders)
+        for failure in failures:
+            print("MISMATCH", failure)
+        print("equivalence check: %s" % ("FAILED" if failures else "ok"))
+        status = 1 if failures else 0
+        seconds, loaded = importTime()
+        slow = seconds > args.import_target
+        if loaded:
+            print("IMPORT ClimateSmoothing loads %s" % ", ".join(loaded))
+        print("cold import: %.3f s (target %.3f s) %s" % (
+            seconds, args.import_target, "FAILED" if slow or loaded else "ok"))
+        if slow or loaded:
+            status = 1
+    if args.check_only:
+        return status
+
+    results = runBenchmarks(args.filters, args.lengths, args.periods, args.orders, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        for result, seconds in compare(results, baseline, args.tolerance):
+            print("REGRESSION %s n=%d period=%d order=%s: %.4f s (baseline %.4f s)" % (
+                result["filter"], result["length"], result["period"], result["order"],
+                result["seconds"], seconds))
+            status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
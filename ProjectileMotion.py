@@ -0,0 +1,402 @@
+# projectile motion of a spinning ball with lift and drag
+# Based on the Projectile-Motion notebook, which derives the force model and
+# the equations of motion. The functions from the notebook are repeated here so
+# they can be imported, together with faster solvers for many trajectories.
+from __future__ import division
+import os
+import sqlite3
+import numpy as np
+from scipy.integrate import ode, solve_ivp
+
+# define the force functions
+# ball lift
+def ballLift(vel,b,s,density):
+    ''' velocity is in m/s, and is a 1x2 array, b is in meters, s in rev/sec, and density in kg/m^3'''
+    # solve for the part of lift that isn't dependent on velocity
+    L1 = 4.0/3.0*4.0*(np.pi**2)*(b**3)*s*density
+    # get the components of lift force
+    # the y component comes from the x velocity
+    # if s > 0 (backspin), then the lift will be in the positive y direction
+    #     - this assumes that all x motion will be forward or zero
+    Ly = L1*vel[0]
+    # the x component comes from the y velocity
+    # if s > 0 (backspin), then positive y motion creates a negative x force
+    #     - the negative sign accounts for this
+    Lx = -L1*vel[1]
+    return np.array([Lx,Ly],dtype=float)
+
+# ball drag
+def ballDrag(vel,b,density,dragCoef):
+    ''' velocity is in m/s, and is a 1x2 array, b is in m'''
+    # solve for velocity independent parts of drag
+    D1 = .5*density*np.pi*b**2*dragCoef
+    Dx = -D1*vel[0]**2
+    Dy = -D1*vel[1]**2
+    return np.array([Dx,Dy],dtype=float)
+
+# gravity
+def gravityForce(m,g):
+    return np.array([0.0,-g*m],dtype=float)
+
+# define the function that sums the forces to get acceleration
+def getAcceleration(vel,b,s,density,dragCoef,m,g):
+    accel = ballLift(vel,b,s,density) + ballDrag(vel,b,density,dragCoef) + gravityForce(m,g)
+    # turn the forces into an acceleration by dividing by mass
+    accel /= m
+    return accel
+
+def F(t,y,b,s,density,dragCoef,m,g):
+    vel = y[2:]
+    pos = y[:2]
+    accel = getAcceleration(vel,b,s,density,dragCoef,m,g)
+    # once we have the acceleration, we can build the output
+    # notice that the velocity at this state is returned as
+    # the rate of change of position
+    output = [y[2],y[3],accel[0],accel[1]]
+    return output
+
+def makeRHS(b,s,density,dragCoef,m,g,out=True):
+    """
+    Returns the right hand side rhs(t,y) of the equations of motion, see F.
+    The lift, drag and gravity terms are fused into two lines of scalar
+    arithmetic with the velocity independent constants worked out once, so a
+    call does not build any temporary arrays.
+    Inputs:
+        b, s, density, dragCoef, m, g: see getTrajectory
+        out: a length 4 array that every call writes into and returns,
+            True (default) to allocate one, or None to return a new array from
+            each call. solve_ivp keeps the arrays it is given, so it needs None;
+            scipy.integrate.ode copies them and can share the buffer.
+    Outputs:
+        rhs: function of (t, y) returning [vx, vy, ax, ay]
+    Example:
+        r = ode(makeRHS(b,s,density,dragCoef,m,g)).set_integrator('dopri5')
+    """
+    # lift and drag constants from ballLift and ballDrag, divided by the mass
+    L = 4.0/3.0*4.0*(np.pi**2)*(b**3)*s*density/m
+    D = .5*density*np.pi*b**2*dragCoef/m
+    if out is True:
+        out = np.empty(4)
+    def rhs(t,y):
+        x, h, vx, vy = y.tolist()
+        output = np.empty(4) if out is None else out
+        output[0] = vx
+        output[1] = vy
+        output[2] = -L*vy - D*vx*vx
+        output[3] = L*vx - D*vy*vy - g
+        return output
+    return rhs
+
+def getTrajectory(b,s,density,dragCoef,m,g,dt,initTime,initVel,initPos,events=False,model=None):
+    # with events the ground is found by root finding, see getTrajectoryEvents
+    if events:
+        return getTrajectoryEvents(b,s,density,dragCoef,m,g,dt,initTime,initVel,initPos,model=model)[0]
+    # make the function to evaluate
+    # the integrator only sees the time and state inputs, the other inputs are
+    # built into the fused right hand side (or the model passed in, such as
+    # lambda t,y:F(t,y,b,s,density,dragCoef,m,g))
+    if model is None:
+        model = makeRHS(b,s,density,dragCoef,m,g)
+    initVals = np.hstack((initPos,initVel))
+    # define our integrator
+    r = ode(model).set_integrator('dopri5', method='adams')
+    r.set_initial_value(initVals, initTime)
+    # create the data storage for the position
+    pos = [initPos]
+    # set the initial conditions
+    r.set_initial_value(initVals, initTime)
+    # loop while the y position is not zero
+    # when the y position is below zero, the ball has hit the ground
+    # this is when we stop the integration
+    while r.successful() and r.y[1] >= 0.0:
+        # get the values at the next time step
+        r.integrate(r.t+dt)
+        # appending is bad form if the arrays will get large
+        pos.append(r.y[0:2])
+    # convert the array to a numpy array for matplotlib
+    pos = np.array(pos)
+    return pos
+
+def groundEvent(t,y):
+    ''' zero when the ball is at the ground, for solve_ivp'''
+    return y[1]
+# stop the integration when the ball comes down to the ground
+groundEvent.terminal = True
+groundEvent.direction = -1
+
+def getTrajectoryEvents(b,s,density,dragCoef,m,g,dt,initTime,initVel,initPos,
+                        maxTime=100.0,rtol=1e-10,atol=1e-10,model=None):
+    """
+    Integrates a trajectory up to the moment the ball lands.
+    Unlike getTrajectory, the integrator takes its own adaptive steps, the
+    landing is found by root finding on y = 0 and the positions every dt are
+    read from the dense output into a preallocated array. The accuracy of
+    the landing point therefore does not depend on dt.
+    Inputs:
+        b, s, density, dragCoef, m, g, dt, initTime, initVel, initPos: see getTrajectory
+        maxTime: longest flight time in seconds that is integrated
+        rtol, atol: tolerances of the integrator
+        model: right hand side rhs(t,y) returning new arrays
+            (default makeRHS(..., out=None))
+    Outputs:
+        pos: positions at initTime, initTime+dt, ... before the landing,
+            followed by the landing point itself (so pos[-1,1] == 0)
+        landingTime: time at which the ball reaches the ground
+        landingRange: x position at which the ball reaches the ground
+    Example:
+        pos, landingTime, landingRange = getTrajectoryEvents(b,s,density,dragCoef,m,g,dt,initTime,initVel,initPos)
+    """
+    if model is None:
+        model = makeRHS(b,s,density,dragCoef,m,g,out=None)
+    initVals = np.hstack((initPos,initVel)).astype(float)
+    sol = solve_ivp(model,(initTime,initTime+maxTime),initVals,method='DOP853',
+                    events=groundEvent,dense_output=True,rtol=rtol,atol=atol)
+    if not sol.success:
+        raise RuntimeError(sol.message)
+    if not len(sol.t_events[0]):
+        raise ValueError("the ball did not land within maxTime = %g s" % maxTime)
+    landingTime = sol.t_events[0][0]
+    landingRange = sol.y_events[0][0][0]
+    # every grid point strictly before the landing, then the landing point
+    steps = max(int(np.ceil((landingTime - initTime)/dt)),1)
+    pos = np.empty((steps+1,2))
+    pos[:steps] = sol.sol(initTime + dt*np.arange(steps))[:2].T
+    pos[steps] = landingRange, 0.0
+    return pos, landingTime, landingRange
+
+# Vectorized force functions for many balls at once. vel is an (N, 2) array of
+# [x, y] velocities, the other inputs are scalars or length N arrays.
+def ballLiftBatch(vel,b,s,density):
+    ''' lift of N balls as an (N, 2) array, see ballLift'''
+    L1 = 4.0/3.0*4.0*(np.pi**2)*(b**3)*s*density
+    lift = np.empty(vel.shape)
+    lift[:,0] = -L1*vel[:,1]
+    lift[:,1] = L1*vel[:,0]
+    return lift
+
+def ballDragBatch(vel,b,density,dragCoef):
+    ''' drag of N balls as an (N, 2) array, see ballDrag'''
+    D1 = np.reshape(.5*density*np.pi*b**2*dragCoef,(-1,1))
+    return -D1*vel**2
+
+def gravityForceBatch(m,g,n):
+    ''' gravity on n balls as an (n, 2) array, see gravityForce'''
+    force = np.zeros((n,2))
+    force[:,1] = -np.asarray(g)*m
+    return force
+
+def getAccelerationBatch(vel,b,s,density,dragCoef,m,g):
+    ''' acceleration of N balls as an (N, 2) array, see getAcceleration'''
+    accel = (ballLiftBatch(vel,b,s,density) + ballDragBatch(vel,b,density,dragCoef)
+             + gravityForceBatch(m,g,len(vel)))
+    accel /= np.reshape(m,(-1,1))
+    return accel
+
+def FBatch(t,y,b,s,density,dragCoef,m,g):
+    ''' derivative of the (N, 4) state [x, y, vx, vy] of N balls, see F'''
+    output = np.empty(y.shape)
+    output[:,:2] = y[:,2:]
+    output[:,2:] = getAccelerationBatch(y[:,2:],b,s,density,dragCoef,m,g)
+    return output
+
+def getTrajectories(b,s,density,dragCoef,m,g,dt,initTime,initVel,initPos):
+    """
+    Integrates N trajectories together, see getTrajectory.
+    The state of all balls is one (N, 4) array that is advanced with a
+    classical 4th order Runge-Kutta step of dt. A ball is dropped from the
+    integration once it is below the ground, so like getTrajectory every
+    trajectory ends with its first point below y = 0.
+    Inputs:
+        b, s, density, dragCoef, m, g: scalars or length N arrays
+        dt: time step in seconds
+        initTime: initial time
+        initVel: initial velocities, [vx, vy] or an (N, 2) array
+        initPos: initial positions, [x, y] or an (N, 2) array
+    Outputs:
+        pos: (N, steps, 2) array of positions, NaN after a trajectory ended
+        counts: length N array with the number of positions of each trajectory,
+            pos[i,:counts[i]] corresponds to getTrajectory for ball i
+    Example:
+        spins = np.array([1.0, -1.0, 0.0])
+        pos, counts = getTrajectories(b,spins,density,dragCoef,m,g,dt,initTime,initVel,initPos)
+    """
+    initVel = np.asarray(initVel,dtype=float)
+    initPos = np.asarray(initPos,dtype=float)
+    columns = np.broadcast_arrays(*[np.atleast_1d(np.asarray(p,dtype=float)) for p in
+                                    (b,s,density,dragCoef,m,g,initPos[...,0],initPos[...,1],
+                                     initVel[...,0],initVel[...,1])])
+    params = columns[:6]
+    n = len(params[0])
+    state = np.column_stack(columns[6:])
+    # one (N, 2) block of positions per time step
+    history = [state[:,:2].copy()]
+    counts = np.ones(n,dtype=int)
+    active = np.flatnonzero(state[:,1] >= 0.0)
+    t = initTime
+    while len(active):
+        y = state[active]
+        p = [param[active] for param in params]
+        k1 = FBatch(t,y,*p)
+        k2 = FBatch(t+dt/2,y+dt/2*k1,*p)
+        k3 = FBatch(t+dt/2,y+dt/2*k2,*p)
+        k4 = FBatch(t+dt,y+dt*k3,*p)
+        y += dt/6*(k1 + 2*k2 + 2*k3 + k4)
+        t += dt
+        state[active] = y
+        step = np.full((n,2),np.nan)
+        step[active] = y[:,:2]
+        history.append(step)
+        counts[active] += 1
+        active = active[y[:,1] >= 0.0]
+    pos = np.stack(history,axis=1)
+    return pos, counts
+
+def splitTrajectories(pos,counts):
+    """Returns the trajectories from getTrajectories as a list of (steps, 2) arrays."""
+    return [pos[i,:count] for i, count in enumerate(counts)]
+
+# Parameter sweeps. Every point of a sweep is one ball, given by these
+# parameters, and is reduced to a few summary metrics.
+SWEEP_PARAMS = ("b","s","density","dragCoef","m","g","vx","vy")
+SWEEP_METRICS = ("flightTime","landingRange","apexHeight")
+# the ball and launch of the Projectile-Motion notebook
+DEFAULTS = dict(b=0.2,s=1.0,density=1.225,dragCoef=0.5,m=4.0,g=9.82,vx=20.0,vy=10.0)
+# results of earlier sweeps are kept in this sqlite file (see sweep)
+SWEEP_CACHE = os.environ.get("PROJECTILE_SWEEP_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache",
+                                          "ProjectileMotion", "sweep.sqlite"))
+
+def apexEvent(t,y):
+    ''' zero when the ball is at the top of its flight, for solve_ivp'''
+    return y[3]
+apexEvent.direction = -1
+
+def getSummary(b,s,density,dragCoef,m,g,initVel,initPos=(0.0,0.0),
+               maxTime=100.0,rtol=1e-10,atol=1e-10):
+    """
+    Returns (flightTime, landingRange, apexHeight) of one ball, found with
+    events like getTrajectoryEvents but without sampling the positions.
+    """
+    initVals = np.hstack((initPos,initVel)).astype(float)
+    sol = solve_ivp(makeRHS(b,s,density,dragCoef,m,g,out=None),(0.0,maxTime),initVals,
+                    method='DOP853',events=(groundEvent,apexEvent),rtol=rtol,atol=atol)
+    if not sol.success:
+        raise RuntimeError(sol.message)
+    if not len(sol.t_events[0]):
+        raise ValueError("the ball did not land within maxTime = %g s" % maxTime)
+    apexHeight = max([initVals[1]] + list(sol.y_events[1][:,1]))
+    return sol.t_events[0][0], sol.y_events[0][0][0], apexHeight
+
+def _sweepChunk(points,options):
+    """Summary metrics of the rows of points (see SWEEP_PARAMS)."""
+    return [getSummary(b,s,density,dragCoef,m,g,(vx,vy),**options)
+            for b, s, density, dragCoef, m, g, vx, vy in points]
+
+def _sweepKey(point,options):
+    # repr gives back the exact floats, so equal parameters give equal keys
+    return repr((tuple(float(p) for p in point), sorted(options.items())))
+
+def _openCache(path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    db = sqlite3.connect(path)
+    db.execute("create table if not exists summary (key text primary key, %s)"
+               % ", ".join("%s real" % metric for metric in SWEEP_METRICS))
+    return db
+
+def _readSweepCache(db,keys,batch=500):
+    """Returns a dict key: metrics of the keys found in the cache."""
+    found = {}
+    for start in range(0,len(keys),batch):
+        part = keys[start:start+batch]
+        found.update((row[0], row[1:]) for row in db.execute(
+            "select key, %s from summary where key in (%s)"
+            % (", ".join(SWEEP_METRICS), ", ".join("?"*len(part))), part))
+    return found
+
+def sweep(grid,workers=None,chunkSize=None,cache=None,maxTime=100.0,rtol=1e-10,atol=1e-10):
+    """
+    Computes the summary metrics of every combination of the parameters in grid,
+    on a process pool and with an on-disk cache of earlier results.
+    Inputs:
+        grid: dict of parameter name (see SWEEP_PARAMS) to a sequence of values.
+            Parameters that are left out take their value from DEFAULTS, and
+            vx and vy are the launch velocity.
+        workers: number of worker processes (default: os.cpu_count()).
+            0 or 1 computes everything in this process.
+        chunkSize: number of points per task (default: about four tasks per worker)
+        cache: sqlite file that keeps the result of every point, keyed by its
+            parameters and the tolerances (default SWEEP_CACHE). Points that are
+            already there are not computed again, so a re-run or an extended
+            grid only computes the new points. False turns the cache off.
+        maxTime, rtol, atol: see getSummary
+    Outputs:
+        results: structured array with one record per point and a field for
+            every parameter and metric (see SWEEP_METRICS). The points are in
+            the order of np.ndindex over the grid, so
+            results.reshape([len(v) for v in grid.values()]) gives the table.
+    Example:
+        results = sweep({"s": np.linspace(-1,1,21), "dragCoef": [0.2,0.5,1.0]})
+        table = results["landingRange"].reshape(21,3)
+    """
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError("unknown sweep parameters: %s" % ", ".join(sorted(unknown)))
+    names = list(grid)
+    axes = np.meshgrid(*[np.asarray(grid[name],dtype=float) for name in names],indexing='ij')
+    n = axes[0].size if axes else 1
+    points = np.empty((n,len(SWEEP_PARAMS)))
+    for i, name in enumerate(SWEEP_PARAMS):
+        points[:,i] = axes[names.index(name)].ravel() if name in grid else DEFAULTS[name]
+    options = dict(maxTime=maxTime,rtol=rtol,atol=atol)
+    metrics = np.empty((n,len(SWEEP_METRICS)))
+
+    if cache is None:
+        cache = SWEEP_CACHE
+    db = _openCache(cache) if cache else None
+    try:
+        keys = [_sweepKey(point,options) for point in points]
+        found = _readSweepCache(db,list(set(keys))) if db is not None else {}
+        todo = []
+        for i, key in enumerate(keys):
+            if key in found:
+                metrics[i] = found[key]
+            else:
+                todo.append(i)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chunkSize is None:
+            chunkSize = max(1, -(-len(todo) // (4*max(workers,1))))
+        chunks = [todo[start:start+chunkSize] for start in range(0,len(todo),chunkSize)]
+        pool = None
+        if workers <= 1 or len(chunks) <= 1:
+            results = (_sweepChunk(points[chunk],options) for chunk in chunks)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(_sweepChunk,[points[chunk] for chunk in chunks],
+                               [options]*len(chunks))
+        try:
+            # results are stored chunk by chunk, so an interrupted sweep keeps
+            # the points that were finished
+            for chunk, values in zip(chunks,results):
+                metrics[chunk] = values
+                if db is not None:
+                    with db:
+                        db.executemany("insert or replace into summary values (?%s)"
+                                       % (", ?"*len(SWEEP_METRICS)),
+                                       [(keys[i],) + tuple(value) for i, value in zip(chunk,values)])
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    finally:
+        if db is not None:
+            db.close()
+
+    out = np.empty(n,dtype=[(name,float) for name in SWEEP_PARAMS + SWEEP_METRICS])
+    for i, name in enumerate(SWEEP_PARAMS):
+        out[name] = points[:,i]
+    for i, name in enumerate(SWEEP_METRICS):
+        out[name] = metrics[:,i]
+    return out
@@ -0,0 +1,92 @@
+# benchmark the ProjectileMotion right hand sides
+# Compares the fused right hand side from makeRHS against the original F (the
+# force functions called through a lambda), both per call and end to end in
+# getTrajectory, and checks that they give the same trajectories.
+#
+# Usage:
+#     python ProjectileMotionBenchmark.py
+#     python ProjectileMotionBenchmark.py --dts 0.01 0.001 --repeat 5
+from __future__ import division
+import argparse
+import sys
+import time
+import numpy as np
+import ProjectileMotion as pm
+
+# the ball from the Projectile-Motion notebook
+BALL = dict(b=0.2, s=1.0, density=1.225, dragCoef=0.5, m=4.0, g=9.82)
+INIT_VEL = np.array([20.0, 10.0])
+INIT_POS = np.array([0.0, 0.0])
+DTS = (0.01, 0.001)
+
+def referenceModel(b,s,density,dragCoef,m,g):
+    """The right hand side as getTrajectory first built it."""
+    return lambda t,y:pm.F(t,y,b,s,density,dragCoef,m,g)
+
+# name: function of the ball parameters returning rhs(t,y)
+MODELS = {
+    "F": referenceModel,
+    "makeRHS": pm.makeRHS,
+}
+
+def best(func,repeat=3,number=1):
+    """Fastest wall time of number calls of func, out of repeat runs."""
+    seconds = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            func()
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+def callsPerSecond(name,calls=100000,repeat=3):
+    rhs = MODELS[name](**BALL)
+    y = np.hstack((INIT_POS,INIT_VEL))
+    return calls / best(lambda: rhs(0.0,y),repeat,calls)
+
+def trajectorySeconds(name,dt,repeat=3):
+    model = MODELS[name](**BALL)
+    return best(lambda: pm.getTrajectory(dt=dt,initTime=0.0,initVel=INIT_VEL,
+                                         initPos=INIT_POS,model=model,**BALL),repeat)
+
+def checkEquivalence(dts=DTS,atol=1e-9):
+    """
+    Compares the trajectories of every model against F.
+    Outputs:
+        failures: list of strings describing mismatches (empty when all agree)
+    """
+    failures = []
+    for dt in dts:
+        old = pm.getTrajectory(dt=dt,initTime=0.0,initVel=INIT_VEL,initPos=INIT_POS,
+                               model=referenceModel(**BALL),**BALL)
+        for name in sorted(MODELS):
+            new = pm.getTrajectory(dt=dt,initTime=0.0,initVel=INIT_VEL,initPos=INIT_POS,
+                                   model=MODELS[name](**BALL),**BALL)
+            if new.shape != old.shape:
+                failures.append("%s dt=%g: shape %r != %r" % (name, dt, new.shape, old.shape))
+            elif not np.allclose(new, old, rtol=0, atol=atol):
+                failures.append("%s dt=%g: max difference %g" % (name, dt, np.abs(new - old).max()))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ProjectileMotion right hand sides.")
+    parser.add_argument("--dts", nargs="+", type=float, default=DTS)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    failures = checkEquivalence(args.dts)
+    for failure in failures:
+        print("MISMATCH", failure)
+    print("equivalence check: %s" % ("FAILED" if failures else "ok"))
+
+    for name in sorted(MODELS):
+        print("%-10s %12.0f rhs calls/s" % (name, callsPerSecond(name,args.calls,args.repeat)))
+    for dt in args.dts:
+        for name in sorted(MODELS):
+            print("%-10s dt=%-7g getTrajectory %10.4f s" % (
+                name, dt, trajectorySeconds(name,dt,args.repeat)))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,6 +33,13 @@ Display cursors, dicts and objects as html-tables.
 
 import IPython.core.display as ipdisp
 import sys
+import time
+import warnings
+from collections import OrderedDict
+from functools import wraps
+from inspect import getmro
+from itertools import islice
+from types import GeneratorType
 from textwrap import wrap
 from pprint import pformat
 
@@ -131,7 +138,166 @@ def remove_extended_styles():
     return ipdisp.HTML(html)
 
 
-def display_html(data, tight=False, projection=None):
+class LargeOutputWarning(UserWarning):
+    """Issued when a display produces more html than the configured limit."""
+
+
+class RenderStats(object):
+    """Render costs collected while enable_stats() is active.
+
+    calls       : Number of calls per renderer.
+    seconds     : Seconds per stage: the renderer names (total time including
+                  nested renderers), "fetch" (cursor fetching) and "format"
+                  (cell formatting, pformat and escaping).
+    rows        : Number of rows rendered.
+    cells       : Number of cells rendered.
+    bytes       : Size of the html returned by the outermost renderers
+                  (characters, which equals bytes for ASCII output).
+    peak_memory : Largest peak of traced memory during a display in bytes
+                  (only with trace_memory)."""
+
+    def __init__(self, warn_bytes=None, trace_memory=False):
+        self.warn_bytes = warn_bytes
+        self.trace_memory = trace_memory
+        self._depth = 0
+        self._started_tracing = False
+        self.reset()
+
+    def reset(self):
+        """Clears all counters."""
+        self.calls = {}
+        self.seconds = {}
+        self.rows = 0
+        self.cells = 0
+        self.bytes = 0
+        self.peak_memory = 0
+
+    def add_time(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def count(self, rows=0, cells=0):
+        self.rows += rows
+        self.cells += cells
+
+    def as_dict(self):
+        return {
+            'calls': dict(self.calls),
+            'seconds': dict(self.seconds),
+            'rows': self.rows,
+            'cells': self.cells,
+            'bytes': self.bytes,
+            'peak_memory': self.peak_memory,
+        }
+
+    def __repr__(self):
+        return "RenderStats(%r)" % (self.as_dict(),)
+
+    def _measure(self, name, function, args, kwargs):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        outermost = self._depth == 0
+        if outermost and self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+        self._depth += 1
+        start = _clock()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            self.add_time(name, _clock() - start)
+            self._depth -= 1
+        if outermost:
+            if self.trace_memory:
+                self.peak_memory = max(
+                    self.peak_memory,
+                    tracemalloc.get_traced_memory()[1]
+                )
+            size = _html_size(result)
+            self.bytes += size
+            if self.warn_bytes is not None and size > self.warn_bytes:
+                warnings.warn(
+                    "%s produced %d bytes of html (limit %d), consider "
+                    "limit or page_size" % (name, size, self.warn_bytes),
+                    LargeOutputWarning,
+                    stacklevel=3
+                )
+        return result
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+_stats = None
+
+
+def enable_stats(warn_bytes=None, trace_memory=False):
+    """Starts collecting render costs, returns the RenderStats object.
+
+    warn_bytes   : Issue a LargeOutputWarning when a display produces more
+                   html than this.
+    trace_memory : Record peak memory with tracemalloc (slows rendering)."""
+    global _stats
+    _stats = RenderStats(warn_bytes, trace_memory)
+    return _stats
+
+
+def disable_stats():
+    """Stops collecting render costs, returns the last RenderStats object."""
+    global _stats
+    stats, _stats = _stats, None
+    if stats is not None and stats._started_tracing:
+        import tracemalloc
+        tracemalloc.stop()
+        stats._started_tracing = False
+    return stats
+
+
+def render_stats():
+    """The active RenderStats object or None."""
+    return _stats
+
+
+def _html_size(result):
+    if type(result) in _TEXT_TYPES:
+        # PagedTable.page_html returns the html itself
+        return len(result)
+    if isinstance(result, PagedTable):
+        return len(result._pages.get(0, ''))
+    data = getattr(result, 'data', None)
+    if data is None:
+        return 0
+    return len(data)
+
+
+def _instrumented(function):
+    """Records calls and time of a renderer while stats are enabled."""
+    name = function.__name__
+
+    @wraps(function)
+    def instrumented(*args, **kwargs):
+        if _stats is None:
+            return function(*args, **kwargs)
+        return _stats._measure(name, function, args, kwargs)
+    return instrumented
+
+
+def _timed_batches(stats, batches):
+    """Passes the batches on, adding the time to fetch them to stats."""
+    batches = iter(batches)
+    while True:
+        start = _clock()
+        try:
+            batch = next(batches)
+        except StopIteration:
+            stats.add_time('fetch', _clock() - start)
+            return
+        stats.add_time('fetch', _clock() - start)
+        yield batch
+
+
+@_instrumented
+def display_html(data, tight=False, projection=None, limit=None,
+                 page_size=None):
     """Displays database-API cursor, dicts or objects as html, fallback to pprint.
 
     Short cut: dh()
@@ -139,6 +305,8 @@ def display_html(data, tight=False, projection=None):
     data       : The data to display.
     tight      : If used with dictonaries, do not textwrap and do not use <pre>.
     projection : A list of fields to display (used for dicts only)
+    limit      : Maximum number of rows to display (used for cursors only)
+    page_size  : Page large dicts and lists of dicts (see PagedTable)
 
 
     Display sql cursors and dictionaries as html-tables, sub dictionaries are
@@ -146,33 +314,87 @@ def display_html(data, tight=False, projection=None):
     lines will have the prefix $.
     Call extended_styles() once in your notebook or qtconsole.
 
+    The renderer is looked up by type, see register_renderer().
+
     """
+    return _resolve_renderer(type(data))(
+        data,
+        tight=tight,
+        projection=projection,
+        limit=limit,
+        page_size=page_size
+    )
+
+dh = display_html
+
+
+_renderers = {}
+_dispatch_cache = {}
+
+
+def register_renderer(type_, renderer):
+    """Registers a renderer for a type (and its subclasses) in display_html.
+
+    type_    : The type to render.
+    renderer : Called as renderer(data, tight=..., projection=..., limit=...,
+               page_size=...), returns something displayable like ipdisp.HTML.
+               None removes the renderer of type_.
 
+    The closest registered base class in the MRO of the data wins. Types
+    without one are rendered as DataFrames (to_html), cursors, objects
+    (__dict__) or with pprint."""
+    if renderer is None:
+        _renderers.pop(type_, None)
+    else:
+        _renderers[type_] = renderer
+    _dispatch_cache.clear()
+
+
+def _resolve_renderer(cls):
+    """Finds the renderer for cls, cached per type."""
+    try:
+        return _dispatch_cache[cls]
+    except KeyError:
+        pass
+    renderer = _display_object
+    for base in getmro(cls):
+        if base in _renderers:
+            renderer = _renderers[base]
+            break
+    _dispatch_cache[cls] = renderer
+    return renderer
+
+
+def _display_object(data, tight=False, projection=None, limit=None,
+                    page_size=None):
     if hasattr(data, 'to_html'):
         return ipdisp.HTML(data.to_html())
     elif hasattr(data, 'description') and hasattr(data, 'fetchall'):
-        return html_cursor(data)
+        return html_cursor(data, limit)
     elif hasattr(data, "__dict__"):
-        return html_dict(data.__dict__, tight, projection)
-    elif str(data.__class__) == "<type 'dict'>":
-        return html_dict(data, tight, projection)
-    elif str(data.__class__) == "<class 'dict'>":
-        return html_dict(data, tight, projection)
-    elif (
-        str(data.__class__) == "<class 'list'>"
-        or
-        str(data.__class__) == "<type 'list'>"
-    ):
-        if len(data) > 0:
-            if (
-                str(data[0].__class__) == "<class 'dict'>"
-                or
-                str(data[0].__class__) == "<type 'dict'>"
-            ):
-                return html_multi_dict(data, tight, projection)
+        return html_dict(data.__dict__, tight, projection, page_size)
     return html_pprint(data)
 
-dh = display_html
+
+def _display_dict(data, tight=False, projection=None, limit=None,
+                  page_size=None):
+    return html_dict(data, tight, projection, page_size)
+
+
+def _display_list(data, tight=False, projection=None, limit=None,
+                  page_size=None):
+    if len(data) > 0 and isinstance(data[0], dict):
+        return html_multi_dict(data, tight, projection, page_size)
+    return html_pprint(data)
+
+
+def _display_generator(data, tight=False, projection=None, limit=None,
+                       page_size=None):
+    if limit is None:
+        data = list(data)
+    else:
+        data = list(islice(data, limit))
+    return _display_list(data, tight, projection, limit, page_size)
 
 
 def pprint_wrap(data):
@@ -181,10 +403,18 @@ def pprint_wrap(data):
                for x in pformat(data).split('\n')]))
 
 
+@_instrumented
 def html_pprint(data):
+    stats = _stats
+    if stats is not None:
+        start = _clock()
+    html = pprint_wrap(data)
+    if stats is not None:
+        stats.add_time('format', _clock() - start)
+        stats.count(rows=1, cells=1)
     return ipdisp.HTML('\n'.join([
         "<pre>",
-        pprint_wrap(data),
+        html,
         "</pre>"]))
 
 
@@ -215,27 +445,163 @@ def _enc_v3(value):
 
 if sys.version_info[0] == 2:
     enc = _enc_v2
+    _text = unicode
+    _NUMBER_TYPES = frozenset([int, long, float, bool, type(None)])
+    _TEXT_TYPES = frozenset([str, unicode])
 else:
     enc = _enc_v3
+    _text = str
+    _NUMBER_TYPES = frozenset([int, float, bool, type(None)])
+    _TEXT_TYPES = frozenset([str])
+
+# Formatted table cells of text type are memoized (one memo per type),
+# categorical columns repeat the same values a lot. A memo is emptied when it
+# reaches _MEMO_SIZE.
+_MEMO_SIZE = 4096
+_enc_memo = dict((cls, {}) for cls in _TEXT_TYPES)
+_pprint_memo = dict((cls, {}) for cls in _TEXT_TYPES)
+
+
+def _enc_cell(value):
+    """enc() for table cells: numbers need no escaping, text is memoized."""
+    cls = type(value)
+    if cls in _NUMBER_TYPES:
+        return _text(value)
+    memo = _enc_memo.get(cls)
+    if memo is None:
+        return enc(value)
+    try:
+        return memo[value]
+    except KeyError:
+        pass
+    if len(memo) >= _MEMO_SIZE:
+        memo.clear()
+    html = memo[value] = enc(value)
+    return html
+
+
+def _pprint_cell(value):
+    """pprint_wrap() for table cells: numbers and text whose repr fits a line
+    skip pformat and wrap, text is memoized."""
+    cls = type(value)
+    if cls in _NUMBER_TYPES:
+        html = repr(value)
+        if len(html) <= 80:
+            return html
+        return pprint_wrap(value)
+    memo = _pprint_memo.get(cls)
+    if memo is None:
+        return pprint_wrap(value)
+    try:
+        return memo[value]
+    except KeyError:
+        pass
+    if len(memo) >= _MEMO_SIZE:
+        memo.clear()
+    html = repr(value)
+    if len(html) <= 80:
+        html = enc(html)
+    else:
+        html = pprint_wrap(value)
+    memo[value] = html
+    return html
 
 
-def html_cursor(cursor):
-    """Pretty prints a generic database API cursor."""
-    if cursor.description is None:
-        ipdisp.display_html(ipdisp.HTML("<i>No data returned</i>"))
-        return
+def _fetch_batches(cursor, batch_size, limit=None):
+    """Yields lists of at most batch_size rows from a cursor, stopping after
+    limit rows."""
+    if hasattr(cursor, 'fetchmany'):
+        fetch = cursor.fetchmany
+    else:
+        rows = iter(cursor)
+        fetch = lambda size: list(islice(rows, size))
+    fetched = 0
+    while limit is None or fetched < limit:
+        if limit is None:
+            batch = fetch(batch_size)
+        else:
+            batch = fetch(min(batch_size, limit - fetched))
+        if not batch:
+            return
+        fetched += len(batch)
+        yield batch
+
+
+def _count_rest(cursor, shown):
+    """Number of rows left in a cursor after shown rows were fetched, or None
+    if the driver does not know (rowcount -1) but there is at least one."""
+    rowcount = getattr(cursor, 'rowcount', -1)
+    if isinstance(rowcount, int) and rowcount >= shown:
+        return rowcount - shown
+    # the driver does not know, and counting would mean fetching the whole
+    # result, so only check for one more row
+    if hasattr(cursor, 'fetchmany'):
+        more = cursor.fetchmany(1)
+    else:
+        more = list(islice(iter(cursor), 1))
+    return None if more else 0
+
+
+def iter_html_cursor(cursor, batch_size=1000, limit=None):
+    """Renders a generic database API cursor as chunks of html.
+
+    cursor     : The cursor to render, description must not be None.
+    batch_size : Number of rows fetched (fetchmany) and rendered per chunk.
+    limit      : Stop after this many rows and add a "N more rows" footer
+                 (just "more rows" when the driver's rowcount is -1, so
+                 that no more than one extra row is fetched).
+
+    Only one batch of rows is held in memory at a time."""
     headers = [x[0] for x in cursor.description]
     header_line = "<tr><th>" + ("</th><th>".join(headers)) + "</th></tr>"
 
     def getrow(row):
-        rendered = ["<tr>"] + ["<td>%s</td>" % enc(row[col])
+        rendered = ["<tr>"] + ["<td>%s</td>" % _enc_cell(row[col])
                    for col in range(0, len(headers))] + ["</tr>"]
         return "".join(rendered)
 
-    rows = [header_line] + [getrow(row) for row in cursor]
-    body = '\n'.join(rows)
-    table = '<table class="nowrap">\n%s\n</table>' % body
-    return ipdisp.HTML(table)
+    yield '<table class="nowrap">\n' + header_line
+    shown = 0
+    stats = _stats
+    batches = _fetch_batches(cursor, batch_size, limit)
+    if stats is not None:
+        batches = _timed_batches(stats, batches)
+    for rows in batches:
+        shown += len(rows)
+        if stats is not None:
+            start = _clock()
+        html = '\n' + '\n'.join([getrow(row) for row in rows])
+        if stats is not None:
+            stats.add_time('format', _clock() - start)
+            stats.count(rows=len(rows), cells=len(rows) * len(headers))
+        yield html
+    if limit is not None and shown >= limit:
+        rest = _count_rest(cursor, shown)
+        if rest is None:
+            yield '\n<tr><td colspan="%d"><i>more rows</i></td></tr>' % (
+                len(headers)
+            )
+        elif rest > 0:
+            yield '\n<tr><td colspan="%d"><i>%d more rows</i></td></tr>' % (
+                len(headers),
+                rest
+            )
+    yield '\n</table>'
+
+
+@_instrumented
+def html_cursor(cursor, limit=None, batch_size=1000):
+    """Pretty prints a generic database API cursor.
+
+    cursor     : The cursor to print.
+    limit      : Only render this many rows, followed by a "N more rows"
+                 footer, so memory does not grow with the size of the result
+                 and at most one row past the limit is fetched.
+    batch_size : Number of rows fetched at a time (see iter_html_cursor)."""
+    if cursor.description is None:
+        ipdisp.display_html(ipdisp.HTML("<i>No data returned</i>"))
+        return
+    return ipdisp.HTML(''.join(iter_html_cursor(cursor, batch_size, limit)))
 
 
 def _table_config(tight):
@@ -243,12 +609,12 @@ def _table_config(tight):
         output = ['<table class="bound"><tr>']
         td_start = "<td>"
         td_end   = "</td>"
-        print_function = enc
+        print_function = _enc_cell
     else:
         output = ['<table class="nowrap"><tr>']
         td_start = "<td><pre>"
         td_end   = "</pre></td>"
-        print_function = pprint_wrap
+        print_function = _pprint_cell
     return (
         output,
         td_start,
@@ -257,61 +623,209 @@ def _table_config(tight):
     )
 
 
-def html_dict(dict_, tight=False, projection=None):
-    """Pretty print a dictionary.
-
-    dict_      : The dict to pretty print.
-    tight      : Do not textwrap and do not use <pre>.
-    projection : A list of fields to display"""
+class PagedTable(object):
+    """A table that is rendered one page at a time.
+
+    Only the first page is rendered up front, the source stays referenced and
+    other pages are rendered when asked for with page(n). The most recently
+    used pages are cached.
+
+    render     : Function (start, stop) -> html of the items start:stop.
+    length     : Number of items in the source.
+    page_size  : Number of items per page.
+    cache_size : Number of rendered pages to keep."""
+
+    def __init__(self, render, length, page_size, cache_size=8):
+        self._render = render
+        self.length = length
+        self.page_size = max(1, page_size)
+        self.cache_size = max(1, cache_size)
+        self._pages = OrderedDict()
+        self.page_html(0)
+
+    @property
+    def pages(self):
+        """Number of pages."""
+        return max(1, -(-self.length // self.page_size))
+
+    @_instrumented
+    def page_html(self, n):
+        """Returns the html of page n (0 based), rendering it if needed."""
+        if n < 0:
+            n += self.pages
+        if not 0 <= n < self.pages:
+            raise IndexError("page %d out of range (%d pages)" % (n, self.pages))
+        try:
+            html = self._pages.pop(n)
+        except KeyError:
+            start = n * self.page_size
+            html = self._render(start, min(start + self.page_size, self.length))
+            while len(self._pages) >= self.cache_size:
+                self._pages.popitem(last=False)
+        self._pages[n] = html
+        footer = "<i>Page %d of %d (%d items), use .page(n) to show others</i>" % (
+            n + 1,
+            self.pages,
+            self.length
+        )
+        return '\n'.join([html, footer])
+
+    def page(self, n):
+        """Displayable html of page n (0 based)."""
+        return ipdisp.HTML(self.page_html(n))
+
+    def _repr_html_(self):
+        return self.page_html(0)
+
+
+def _render_dict(dict_, fields, tight):
     (
         output,
         td_start,
         td_end,
         print_function
     ) = _table_config(tight)
-
-    fields = None
-    if projection is None:
-        fields = dict_
-    else:
-        fields = projection
     for key in fields:
         output += ["<th>", key, "</th>"]
     output += ["</tr><tr>"]
+    stats = _stats
+    if stats is not None:
+        start = _clock()
     for key in fields:
         output += [td_start, print_function(dict_[key]), td_end]
+    if stats is not None:
+        stats.add_time('format', _clock() - start)
+        stats.count(rows=1, cells=len(fields))
     output += ["</table>"]
-    return ipdisp.HTML('\n'.join(output))
+    return '\n'.join(output)
 
 
-def html_multi_dict(array_, tight=False, projection=None):
-    """Pretty print an array of dictionaries.
+_MISSING = object()
 
-    array_     : The multi dict to pretty print.
-    tight      : Do not textwrap and do not use <pre>.
-    projection : A list of fields to display"""
+
+def _format_column(values, print_function):
+    """Formats a column of cells, missing cells are left empty.
+
+    Columns holding only ints or only floats are formatted with a single
+    map() over the column."""
+    kinds = set(map(type, values))
+    if len(kinds) == 1:
+        kind = kinds.pop()
+        if kind in _NUMBER_TYPES and kind is not type(None):
+            if print_function is _enc_cell:
+                return list(map(_text, values))
+            cells = list(map(repr, values))
+            if max(map(len, cells)) <= 80:
+                return cells
+    return [
+        '' if value is _MISSING else print_function(value)
+        for value in values
+    ]
+
+
+def _render_multi_dict(array_, fields, tight, start, stop):
+    """Renders the dicts start:stop of array_ column by column."""
     (
         output,
         td_start,
         td_end,
         print_function
     ) = _table_config(tight)
+    for key in fields:
+        output += ["<th>", key, "</th>"]
+    records = array_[start:stop]
+    stats = _stats
+    if stats is not None:
+        t0 = _clock()
+    columns = [
+        _format_column(
+            [record.get(key, _MISSING) for record in records],
+            print_function
+        )
+        for key in fields
+    ]
+    if stats is not None:
+        stats.add_time('format', _clock() - t0)
+        stats.count(rows=len(records), cells=len(records) * len(fields))
+    if columns:
+        start_row = '\n'.join(['<tr>', td_start, ''])
+        between = '\n'.join(['', td_end, td_start, ''])
+        end_row = '\n'.join(['', td_end, '</tr>'])
+        output += [
+            start_row + between.join(cells) + end_row
+            for cells in zip(*columns)
+        ]
+    else:
+        output += ['<tr>\n</tr>'] * len(records)
+    output += ["</table>"]
+    return '\n'.join(output)
+
+
+@_instrumented
+def html_dict(dict_, tight=False, projection=None, page_size=None):
+    """Pretty print a dictionary.
+
+    dict_      : The dict to pretty print.
+    tight      : Do not textwrap and do not use <pre>.
+    projection : A list of fields to display
+    page_size  : Show this many fields at a time (returns a PagedTable)"""
     fields = None
     if projection is None:
-        fields = array_[0]
+        fields = dict_
     else:
         fields = projection
+    if page_size is not None and len(fields) > page_size:
+        fields = list(fields)
+        return PagedTable(
+            lambda start, stop: _render_dict(dict_, fields[start:stop], tight),
+            len(fields),
+            page_size
+        )
+    return ipdisp.HTML(_render_dict(dict_, fields, tight))
+
+
+@_instrumented
+def html_multi_dict(array_, tight=False, projection=None, page_size=None):
+    """Pretty print an array of dictionaries.
+
+    array_     : The multi dict to pretty print.
+    tight      : Do not textwrap and do not use <pre>.
+    projection : A list of fields to display
+    page_size  : Show this many dicts at a time (returns a PagedTable)
+
+    The fields are those of the first dict unless projected, cells of dicts
+    that lack a field are left empty."""
     if len(array_) < 1:
         return ipdisp.HTML("")
-    for key in fields:
-        output += ["<th>", key, "</th>"]
-    for dict_ in array_:
-        output += ['<tr>']
-        for key in fields:
-            output += [td_start, print_function(dict_[key]), td_end]
-        output += ['</tr>']
-    output += ["</table>"]
-    return ipdisp.HTML('\n'.join(output))
+    fields = None
+    if projection is None:
+        fields = list(array_[0])
+    else:
+        fields = list(projection)
+    if page_size is not None and len(array_) > page_size:
+        return PagedTable(
+            lambda start, stop: _render_multi_dict(
+                array_,
+                fields,
+                tight,
+                start,
+                stop
+            ),
+            len(array_),
+            page_size
+        )
+    return ipdisp.HTML(_render_multi_dict(
+        array_,
+        fields,
+        tight,
+        0,
+        len(array_)
+    ))
+
+
+register_renderer(dict, _display_dict)
+register_renderer(list, _display_list)
+register_renderer(GeneratorType, _display_generator)
 
 
 def solarized():
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# vim: autoindent expandtab tabstop=4 sw=4 sts=4 filetype=python
+
+"""
+Micro-benchmark of the per-cell cost of the display renderers.
+
+Usage: python display_benchmark.py [rows]
+
+Prints microseconds per rendered cell for html_cursor, html_dict and
+html_multi_dict (tight and wrapped), next to the cost of formatting the same
+cells with the plain enc() and pprint_wrap() functions.
+"""
+
+from __future__ import print_function
+import sqlite3
+import sys
+import timeit
+
+import display
+
+COLUMNS = ["id", "ratio", "state", "country", "comment", "tags"]
+STATES = ["new", "open", "closed", "<b>wontfix</b>"]
+COUNTRIES = ["CH", "DE", "FR", "IT", "AT & LI"]
+
+
+def make_records(rows):
+    """List of dicts with numeric, categorical, free text and nested cells."""
+    return [
+        {
+            "id": i,
+            "ratio": i / 7.0,
+            "state": STATES[i % len(STATES)],
+            "country": COUNTRIES[i % len(COUNTRIES)],
+            "comment": "comment number %d with some <text> in it" % i,
+            "tags": {"level": i % 3, "owner": "user%d" % (i % 11)},
+        }
+        for i in range(rows)
+    ]
+
+
+def make_cursor(records):
+    """In-memory sqlite cursor over the scalar columns of the records."""
+    columns = COLUMNS[:-1]
+    db = sqlite3.connect(":memory:")
+    db.execute("create table t (%s)" % ", ".join(columns))
+    db.executemany(
+        "insert into t values (%s)" % ", ".join("?" * len(columns)),
+        [[record[column] for column in columns] for record in records]
+    )
+    return db, len(columns)
+
+
+def per_cell(function, cells, number):
+    """Best time per cell of function() in microseconds."""
+    best = min(timeit.repeat(function, number=number, repeat=3))
+    return best / number / cells * 1e6
+
+
+def main(rows=2000):
+    records = make_records(rows)
+    db, cursor_columns = make_cursor(records)
+    cells = rows * len(COLUMNS)
+    values = [record[column] for record in records for column in COLUMNS]
+
+    def plain(format_cell):
+        return lambda: [format_cell(value) for value in values]
+
+    results = [
+        ("enc() per cell", plain(display.enc), cells),
+        ("pprint_wrap() per cell", plain(display.pprint_wrap), cells),
+        ("tight cell format", plain(display._enc_cell), cells),
+        ("wrapped cell format", plain(display._pprint_cell), cells),
+        ("html_cursor", lambda: display.html_cursor(
+            db.execute("select * from t")), rows * cursor_columns),
+        ("html_dict tight", lambda: [
+            display.html_dict(record, True) for record in records], cells),
+        ("html_dict", lambda: [
+            display.html_dict(record) for record in records], cells),
+        ("html_multi_dict tight", lambda: display.html_multi_dict(
+            records, True), cells),
+        ("html_multi_dict", lambda: display.html_multi_dict(records), cells),
+    ]
+    print("%d rows, %d columns" % (rows, len(COLUMNS)))
+    for name, function, count in results:
+        print("%-24s %8.3f us/cell" % (name, per_cell(function, count, 3)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])